@@ -0,0 +1,119 @@
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# === PERFIL DE ALMACENAMIENTO ===
+# SQLite (instance/trading_bot.db bajo gunicorn): WAL para que las lecturas del
+# dashboard no bloqueen al escritor diferido ni al revés, synchronous=NORMAL (en WAL
+# solo se sincroniza en los checkpoints), mmap y caché de páginas dimensionada para
+# que las consultas del dashboard no vayan al disco, y busy_timeout para que dos
+# workers que escriben a la vez esperen en lugar de fallar con "database is locked".
+#
+# Postgres (DATABASE_URL): pool de conexiones dimensionado y pre-ping para descartar
+# conexiones que el servidor haya cerrado.
+
+PRAGMAS_SQLITE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_MB', 256)) * 1024 * 1024,
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_MB', 64)) * 1024,  # negativo: KiB
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'temp_store': 'MEMORY',
+}
+
+def normalizar_url(url):
+    # Heroku/Replit entregan "postgres://", que SQLAlchemy 1.4+ ya no acepta
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def opciones_motor(url):
+    if url.startswith('sqlite'):
+        return {'connect_args': {'timeout': PRAGMAS_SQLITE['busy_timeout'] / 1000, 'check_same_thread': False}}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
+@event.listens_for(Engine, 'connect')
+def aplicar_pragmas_sqlite(conexion, registro):
+    # Se aplica a cada conexión nueva; journal_mode=WAL queda grabado en el fichero
+    if not isinstance(conexion, sqlite3.Connection):
+        return
+    cursor = conexion.cursor()
+    for pragma, valor in PRAGMAS_SQLITE.items():
+        cursor.execute(f"PRAGMA {pragma}={valor}")
+    cursor.close()
+
+# === BENCHMARK: python almacenamiento.py ===
+# Escritores que insertan trades en transacciones pequeñas (como el escritor diferido)
+# y lectores que repiten las consultas del dashboard, contra un fichero temporal, con
+# el journal por defecto y con este perfil.
+if __name__ == "__main__":
+    import time
+    import random
+    import tempfile
+    import threading
+    from sqlalchemy import create_engine, text
+
+    SEGUNDOS = 5
+    ESCRITORES = 2
+    LECTORES = 4
+
+    def medir_perfil(nombre, pragmas):
+        ruta = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        PRAGMAS_SQLITE.clear()
+        PRAGMAS_SQLITE.update(pragmas)
+        motor = create_engine(f"sqlite:///{ruta}", **opciones_motor('sqlite'))
+        with motor.begin() as c:
+            c.execute(text("CREATE TABLE trade (id INTEGER PRIMARY KEY, symbol TEXT, quantity REAL, "
+                           "price REAL, status TEXT, created_at REAL)"))
+            c.execute(text("INSERT INTO trade (symbol, quantity, price, status, created_at) VALUES "
+                           "(:s, 1, 2000, 'FILLED', :t)"), [{'s': f"SYM{i % 20}", 't': i} for i in range(20000)])
+        fin = time.monotonic() + SEGUNDOS
+        cuentas = {'escrituras': 0, 'lecturas': 0, 'bloqueos': 0}
+        cerrojo = threading.Lock()
+
+        def escribir():
+            while time.monotonic() < fin:
+                try:
+                    with motor.begin() as c:
+                        c.execute(text("INSERT INTO trade (symbol, quantity, price, status, created_at) VALUES "
+                                       "(:s, 1, 2000, 'FILLED', :t)"),
+                                  [{'s': f"SYM{random.randrange(20)}", 't': time.time()} for _ in range(10)])
+                    with cerrojo:
+                        cuentas['escrituras'] += 1
+                except Exception:
+                    with cerrojo:
+                        cuentas['bloqueos'] += 1
+
+        def leer():
+            while time.monotonic() < fin:
+                try:
+                    with motor.connect() as c:
+                        c.execute(text("SELECT * FROM trade ORDER BY created_at DESC LIMIT 50")).fetchall()
+                        c.execute(text("SELECT symbol, count(*), sum(quantity * price) FROM trade GROUP BY symbol")).fetchall()
+                    with cerrojo:
+                        cuentas['lecturas'] += 1
+                except Exception:
+                    with cerrojo:
+                        cuentas['bloqueos'] += 1
+
+        hilos = [threading.Thread(target=escribir) for _ in range(ESCRITORES)]
+        hilos += [threading.Thread(target=leer) for _ in range(LECTORES)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        motor.dispose()
+        print(f"{nombre:<10} {cuentas['escrituras'] / SEGUNDOS:>8.0f} lotes escritos/s "
+              f"{cuentas['lecturas'] / SEGUNDOS:>8.0f} lecturas/s {cuentas['bloqueos']:>6} bloqueos")
+
+    perfil = dict(PRAGMAS_SQLITE)
+    medir_perfil("por defecto", {'busy_timeout': perfil['busy_timeout']})
+    medir_perfil("perfil", perfil)
@@ -0,0 +1,261 @@
+from datetime import datetime, timedelta
+
+# === ANALÍTICA MATERIALIZADA (TradingAnalytics) ===
+# Cada posición cerrada suma en la fila (símbolo, día) de su fecha de cierre y en la
+# fila global (SIMBOLO_GLOBAL) del mismo día: contadores, beneficio y pérdida brutos,
+# volumen, PnL acumulado del día y sus máximo y mínimo corridos (peak_pnl,
+# trough_pnl), de los que sale el max_drawdown del día.
+#
+# Las consultas leen esas filas, no los trades: un periodo de N días son N filas por
+# símbolo. El drawdown de varios días se combina en orden de fecha con el pico
+# global arrastrado: dentro del día cuenta el max_drawdown de la fila y, desde un
+# pico anterior, la caída hasta el mínimo del día (equity de inicio + trough_pnl).
+
+SIMBOLO_GLOBAL = 'ALL'
+
+def acumular_cierre(fila, cierre):
+    pnl = cierre['pnl']
+    fila.total_trades = (fila.total_trades or 0) + 1
+    if pnl > 0:
+        fila.winning_trades = (fila.winning_trades or 0) + 1
+        fila.gross_profit = (fila.gross_profit or 0.0) + pnl
+    elif pnl < 0:
+        fila.losing_trades = (fila.losing_trades or 0) + 1
+        fila.gross_loss = (fila.gross_loss or 0.0) - pnl
+    fila.total_volume = (fila.total_volume or 0.0) + cierre['volumen']
+    fila.total_pnl = (fila.total_pnl or 0.0) + pnl
+    fila.peak_pnl = max(fila.peak_pnl or 0.0, fila.total_pnl)
+    fila.trough_pnl = min(fila.trough_pnl or 0.0, fila.total_pnl)
+    fila.max_drawdown = max(fila.max_drawdown or 0.0, fila.peak_pnl - fila.total_pnl)
+    resumen = _derivadas(fila.total_trades, fila.winning_trades or 0, fila.losing_trades or 0,
+                         fila.gross_profit or 0.0, fila.gross_loss or 0.0)
+    fila.win_rate = resumen['win_rate']
+    fila.avg_win = resumen['avg_win']
+    fila.avg_loss = resumen['avg_loss']
+    # En la fila no se guarda infinito; al leer se devuelve None (∞) si no hubo pérdidas
+    fila.profit_factor = resumen['profit_factor'] if fila.gross_loss else 0.0
+
+def _derivadas(total, ganadoras, perdedoras, beneficio, perdida):
+    # profit_factor sin pérdidas es infinito: va como None porque JSON no tiene Infinity
+    return {
+        'win_rate': ganadoras / total * 100 if total else 0.0,
+        'avg_win': beneficio / ganadoras if ganadoras else 0.0,
+        'avg_loss': perdida / perdedoras if perdedoras else 0.0,
+        'profit_factor': beneficio / perdida if perdida else (None if beneficio else 0.0),
+    }
+
+def combinar_filas(filas):
+    # filas de un mismo símbolo en orden de fecha
+    if not filas:
+        return None
+    total = ganadoras = perdedoras = 0
+    beneficio = perdida = volumen = 0.0
+    equity = pico = drawdown = 0.0
+    for fila in filas:
+        total += fila.total_trades or 0
+        ganadoras += fila.winning_trades or 0
+        perdedoras += fila.losing_trades or 0
+        beneficio += fila.gross_profit or 0.0
+        perdida += fila.gross_loss or 0.0
+        volumen += fila.total_volume or 0.0
+        drawdown = max(drawdown, fila.max_drawdown or 0.0, pico - (equity + (fila.trough_pnl or 0.0)))
+        pico = max(pico, equity + (fila.peak_pnl or 0.0))
+        equity += fila.total_pnl or 0.0
+    resultado = {
+        'total_trades': total,
+        'winning_trades': ganadoras,
+        'losing_trades': perdedoras,
+        'total_pnl': equity,
+        'total_volume': volumen,
+        'max_drawdown': drawdown,
+        'days': len(filas),
+    }
+    resultado.update(_derivadas(total, ganadoras, perdedoras, beneficio, perdida))
+    return resultado
+
+def _desde(days):
+    return (datetime.utcnow() - timedelta(days=days - 1)).date()
+
+def calcular_analiticas(symbol=None, days=30):
+    # Resumen de los últimos `days` días de un símbolo (o global); None si no hay datos
+    from models import TradingAnalytics
+
+    filas = (TradingAnalytics.query
+             .filter(TradingAnalytics.symbol == (symbol or SIMBOLO_GLOBAL), TradingAnalytics.date >= _desde(days))
+             .order_by(TradingAnalytics.date)
+             .all())
+    return combinar_filas(filas)
+
+def calcular_analiticas_por_simbolo(simbolos, days=30):
+    # Una sola consulta para todos los símbolos de la página
+    from models import TradingAnalytics
+
+    filas = (TradingAnalytics.query
+             .filter(TradingAnalytics.symbol.in_(simbolos), TradingAnalytics.date >= _desde(days))
+             .order_by(TradingAnalytics.symbol, TradingAnalytics.date)
+             .all())
+    por_simbolo = {simbolo: [] for simbolo in simbolos}
+    for fila in filas:
+        por_simbolo[fila.symbol].append(fila)
+    return {simbolo: combinar_filas(filas) for simbolo, filas in por_simbolo.items()}
+
+# === MOTOR VECTORIAL PARA VENTANAS AD HOC ===
+# Para ventanas que no son días completos (desde/hasta arbitrarios) y para métricas
+# que los rollups no guardan (curva de equity, Sharpe, Sortino), se cargan de una vez
+# las posiciones cerradas de la ventana como columnas y se calculan todos los
+# símbolos en una sola pasada con groupby. pandas y numpy se importan al usarlo.
+# Sharpe y Sortino salen del PnL diario (los días sin cierres cuentan como cero),
+# anualizados con 365 días porque el mercado no cierra.
+
+def consulta_cierres(desde=None, hasta=None, symbol=None):
+    # Posiciones cerradas con PnL en [desde, hasta); baja por ix_position_closed_at
+    from app import db
+    from models import Position
+
+    consulta = db.select(
+        Position.symbol, Position.closed_at, Position.realized_pnl,
+        Position.quantity, Position.entry_price, Position.close_price,
+    ).where(Position.close_price.isnot(None), Position.closed_at.isnot(None))
+    if desde:
+        consulta = consulta.where(Position.closed_at >= desde)
+    if hasta:
+        consulta = consulta.where(Position.closed_at < hasta)
+    if symbol:
+        consulta = consulta.where(Position.symbol == symbol)
+    return consulta
+
+def cargar_cierres(desde=None, hasta=None, symbol=None):
+    import pandas as pd
+    from app import db
+
+    with db.engine.connect() as conexion:
+        return pd.read_sql(consulta_cierres(desde, hasta, symbol), conexion, parse_dates=['closed_at'])
+
+def metricas_vectoriales(cierres, desde=None, hasta=None, curva=False):
+    # cierres: DataFrame con symbol, closed_at, realized_pnl, quantity, entry_price, close_price.
+    # Los símbolos se factorizan una vez a enteros y el global es un código más: las
+    # sumas salen de np.bincount, el drawdown de un cumsum/cummax agrupado y el PnL
+    # diario de una matriz (clave × día) con los días sin cierres a cero.
+    import numpy as np
+    import pandas as pd
+
+    if cierres.empty:
+        return {}
+    cierres = cierres.sort_values('closed_at', kind='stable')
+    instantes = cierres['closed_at'].to_numpy()
+    inicio = pd.Timestamp(desde) if desde is not None else pd.Timestamp(instantes[0]).floor('D')
+    fin = pd.Timestamp(hasta) if hasta is not None else pd.Timestamp(instantes[-1])
+    dias = max(1, -(-(fin - inicio) // pd.Timedelta(days=1)))
+
+    codigos, simbolos = pd.factorize(cierres['symbol'], sort=False)
+    global_ = len(simbolos)
+    claves = list(simbolos) + [SIMBOLO_GLOBAL]
+    n = len(claves)
+    # Cada cierre cuenta en su símbolo y en el global
+    codigos = np.concatenate([codigos, np.full(len(cierres), global_)])
+    pnl = np.tile(cierres['realized_pnl'].fillna(0.0).to_numpy(dtype=float), 2)
+    volumen = np.tile((cierres['quantity'] * (cierres['entry_price'].fillna(0) + cierres['close_price'])).to_numpy(dtype=float), 2)
+    dia = np.tile(np.clip((instantes - inicio.to_datetime64()) // np.timedelta64(1, 'D'), 0, dias - 1).astype(np.int64), 2)
+
+    total = np.bincount(codigos, minlength=n)
+    ganadoras = np.bincount(codigos, weights=pnl > 0, minlength=n)
+    perdedoras = np.bincount(codigos, weights=pnl < 0, minlength=n)
+    beneficio = np.bincount(codigos, weights=np.clip(pnl, 0, None), minlength=n)
+    perdida = np.bincount(codigos, weights=np.clip(-pnl, 0, None), minlength=n)
+    total_pnl = np.bincount(codigos, weights=pnl, minlength=n)
+    total_volumen = np.bincount(codigos, weights=volumen, minlength=n)
+
+    serie = pd.Series(pnl)
+    equity = serie.groupby(codigos).cumsum()
+    pico = np.maximum(equity.groupby(codigos).cummax().to_numpy(), 0.0)
+    drawdown = np.zeros(n)
+    np.maximum.at(drawdown, codigos, pico - equity.to_numpy())
+
+    diario = np.bincount(codigos * dias + dia, weights=pnl, minlength=n * dias).reshape(n, dias)
+    media = diario.mean(axis=1)
+    desviacion = diario.std(axis=1, ddof=1) if dias > 1 else np.zeros(n)
+    caida = np.sqrt((np.clip(diario, None, 0) ** 2).mean(axis=1))
+    anual = np.sqrt(365)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(desviacion > 0, media / desviacion * anual, 0.0)
+        sortino = np.where(caida > 0, media / caida * anual, 0.0)
+        win_rate = ganadoras / total * 100
+        avg_win = np.where(ganadoras > 0, beneficio / ganadoras, 0.0)
+        avg_loss = np.where(perdedoras > 0, perdida / perdedoras, 0.0)
+        profit_factor = np.where(perdida > 0, beneficio / perdida, np.where(beneficio > 0, np.inf, 0.0))
+
+    resultado = {}
+    for i, clave in enumerate(claves):
+        resultado[clave] = {
+            'total_trades': int(total[i]),
+            'winning_trades': int(ganadoras[i]),
+            'losing_trades': int(perdedoras[i]),
+            'total_pnl': float(total_pnl[i]),
+            'total_volume': float(total_volumen[i]),
+            'max_drawdown': float(drawdown[i]),
+            'win_rate': float(win_rate[i]),
+            'avg_win': float(avg_win[i]),
+            'avg_loss': float(avg_loss[i]),
+            'profit_factor': float(profit_factor[i]) if np.isfinite(profit_factor[i]) else None,
+            'sharpe': float(sharpe[i]),
+            'sortino': float(sortino[i]),
+            'days': dias,
+        }
+    if curva:
+        momentos = np.tile(instantes, 2)
+        valores = equity.to_numpy()
+        for i, posiciones in pd.Series(codigos).groupby(codigos).indices.items():
+            resultado[claves[i]]['equity_curve'] = [
+                [pd.Timestamp(t).isoformat(), float(e)] for t, e in zip(momentos[posiciones], valores[posiciones])
+            ]
+    return resultado
+
+def analizar_ventana(desde=None, hasta=None, symbol=None, curva=False):
+    # Métricas de la ventana [desde, hasta) para cada símbolo y el global (SIMBOLO_GLOBAL)
+    cierres = cargar_cierres(desde, hasta, symbol)
+    return metricas_vectoriales(cierres, desde, hasta or datetime.utcnow(), curva)
+
+# === BENCHMARK: python analitica.py ===
+# Una pasada agrupada frente a recalcular símbolo a símbolo recorriendo los cierres.
+if __name__ == "__main__":
+    import time
+    import numpy as np
+    import pandas as pd
+
+    def por_simbolo_en_bucle(cierres):
+        resultado = {}
+        for simbolo in cierres['symbol'].unique():
+            filas = cierres[cierres['symbol'] == simbolo].sort_values('closed_at')
+            equity = pico = drawdown = beneficio = perdida = 0.0
+            ganadoras = perdedoras = 0
+            for pnl in filas['realized_pnl']:
+                equity += pnl
+                pico = max(pico, equity)
+                drawdown = max(drawdown, pico - equity)
+                if pnl > 0:
+                    ganadoras += 1
+                    beneficio += pnl
+                elif pnl < 0:
+                    perdedoras += 1
+                    perdida -= pnl
+            resultado[simbolo] = (ganadoras, perdedoras, beneficio, perdida, equity, drawdown)
+        return resultado
+
+    generador = np.random.default_rng(7)
+    for filas in (100_000, 1_000_000):
+        cierres = pd.DataFrame({
+            'symbol': generador.choice([f"SYM{i}USDT" for i in range(50)], filas),
+            'closed_at': pd.Timestamp('2025-01-01') + pd.to_timedelta(np.sort(generador.integers(0, 365 * 86400, filas)), unit='s'),
+            'realized_pnl': generador.normal(0.5, 10, filas),
+            'quantity': generador.uniform(0.01, 1, filas),
+            'entry_price': generador.uniform(100, 200, filas),
+            'close_price': generador.uniform(100, 200, filas),
+        })
+        inicio = time.perf_counter()
+        vectorial = metricas_vectoriales(cierres, '2025-01-01', '2026-01-01')
+        t_vectorial = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        bucle = por_simbolo_en_bucle(cierres)
+        t_bucle = time.perf_counter() - inicio
+        assert all(abs(vectorial[s]['max_drawdown'] - bucle[s][5]) < 1e-6 for s in bucle)
+        print(f"{filas:>9} cierres: vectorial {t_vectorial * 1000:8.1f} ms | símbolo a símbolo {t_bucle * 1000:8.1f} ms")
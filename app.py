@@ -1,18 +1,100 @@
-from flask import Flask, request, jsonify
-from trading_bot import ejecutar_senal_tv
+import os
+import sys
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask_sqlalchemy import SQLAlchemy
+
+from almacenamiento import normalizar_url, opciones_motor
 
 app = Flask(__name__)
+# flash() del dashboard guarda los mensajes en la sesión firmada. Sin SESSION_SECRET
+# se usa una clave aleatoria del proceso: los mensajes pueden perderse entre workers.
+app.secret_key = os.environ.get("SESSION_SECRET") or os.urandom(32)
+app.config["SQLALCHEMY_DATABASE_URI"] = normalizar_url(os.environ.get("DATABASE_URL", "sqlite:///trading_bot.db"))
+# WAL y pragmas en SQLite, pool con pre-ping en Postgres (ver almacenamiento.py)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = opciones_motor(app.config["SQLALCHEMY_DATABASE_URI"])
+db = SQLAlchemy(app)
+
+with app.app_context():
+    import models  # noqa: F401
+    from migraciones import migrar
+    db.create_all()
+    migrar(db)
+
+# El motor se arranca después de crear `db`: sincroniza TradingPair al cargar los mercados.
+# iniciar() no hace llamadas de red (el precalentamiento sigue en segundo plano) y no
+# lanza excepciones: si faltan claves o config.json, /webhook responde 503 y /estado
+# dice por qué.
+import trading_bot
+from trading_bot import motor, procesar_senal_tv, ejecutar_senal, encolar_senal, estado_motor
+from idempotencia import clave_senal, id_alerta
+
+motor.iniciar()
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
+    if not motor.disponible():
+        return jsonify({'error': 'Motor de trading no disponible', 'motivo': motor.error}), 503
+
     data = request.get_json(force=True)
 
     mensaje = data.get('message') or data.get('alert_message') or ''
+    if not mensaje and ('accion' in data or 'action' in data):
+        # Alerta estructurada: los campos de la señal vienen en el propio JSON
+        mensaje = data
     if not mensaje:
         return jsonify({'error': 'No se encontró mensaje en el webhook'}), 400
 
-    ejecutar_senal_tv(mensaje)
-    return jsonify({'status': 'Señal recibida y ejecutada correctamente'}), 200
+    senal = procesar_senal_tv(mensaje)
+    if not senal:
+        return jsonify({'error': 'Mensaje de señal no válido'}), 400
+
+    # Se responde 200 a los duplicados para que TradingView no siga reintentando
+    clave = clave_senal(mensaje, data)
+    registro_idempotencia = trading_bot.registro_idempotencia
+    if not registro_idempotencia.reclamar(clave, con_id=bool(id_alerta(data))):
+        return jsonify({'status': 'Señal duplicada ignorada'}), 200
+    senal.clave = clave
+
+    if trading_bot.config.get('modo_ingesta', 'asincrono') == 'sincrono':
+        ejecutar_senal(senal)
+        return jsonify({'status': 'Señal recibida y ejecutada correctamente'}), 200
+
+    if not encolar_senal(senal):
+        registro_idempotencia.liberar(clave)
+        return jsonify({'error': 'Cola de ejecución llena, señal rechazada'}), 503
+    return jsonify({'status': 'Señal recibida y encolada para ejecución'}), 202
+
+@app.route('/estado', methods=['GET'])
+def estado():
+    return jsonify(estado_motor()), 200
+
+def worker_sincrono(entorno):
+    # Worker sync de gunicorn: atiende una petición a la vez, así que un stream
+    # abierto dejaría /webhook sin servir mientras la pestaña siga abierta
+    if not entorno.get('SERVER_SOFTWARE', '').startswith('gunicorn') or entorno.get('wsgi.multithread'):
+        return False
+    monkey = sys.modules.get('gevent.monkey')
+    return not (monkey and monkey.is_module_patched('socket'))
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    # Server-Sent Events: deltas de trades, posiciones y balance (ver eventos.py).
+    # Cada conexión ocupa un hilo mientras está abierta: gunicorn se lanza con
+    # workers gthread (.replit); con workers sync se rechaza y la página sondea.
+    if worker_sincrono(request.environ):
+        return jsonify({'error': 'Stream no disponible con workers sync de gunicorn; usa --worker-class gthread o gevent'}), 503
+    if not motor.disponible():
+        return jsonify({'error': 'Motor de trading no disponible', 'motivo': motor.error}), 503
+    ultimo_id = request.headers.get('Last-Event-ID')
+    ultimo_id = int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None
+    return Response(
+        stream_with_context(trading_bot.bus_eventos.escuchar(ultimo_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+# Páginas y API del dashboard (/, /api/trades, /api/positions, /analytics...)
+import routes  # noqa: E402,F401
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000)
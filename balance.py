@@ -0,0 +1,135 @@
+import time
+import logging
+from threading import Thread, Lock, Event
+
+# === SERVICIO DE BALANCE EN MEMORIA ===
+# Guarda el último wallet balance y el margen disponible de la cuenta de futuros.
+# Se actualiza con los ACCOUNT_UPDATE del stream de usuario y con un sondeo REST
+# cada `intervalo` segundos. Quien dimensiona una orden pide una instantánea con
+# su edad y puede exigir "fresca en N ms"; solo entonces se hace una llamada REST.
+#
+# ACCOUNT_UPDATE solo llega cuando el balance cambia, así que un dato sin cambios
+# envejece hasta el siguiente sondeo: `frescura_ms`, la frescura por defecto, nunca
+# es menor que el intervalo de sondeo (más `frescura_ms` de margen), o casi todas
+# las señales acabarían en una llamada REST.
+#
+# Las dos fuentes guardan las mismas cifras: walletBalance (el 'wb' del stream) y
+# availableBalance. El 'total' de ccxt es marginBalance (incluye el PnL no
+# realizado) y no se mezcla con ellas.
+
+class ServicioBalance:
+    def __init__(self, consultar_balance, activo='USDT', intervalo=30, frescura_ms=5000):
+        self.consultar_balance = consultar_balance
+        self.activo = activo
+        self.intervalo = intervalo
+        self.frescura_ms = intervalo * 1000 + frescura_ms
+        self.total = None
+        self.disponible = None
+        self.actualizado = None
+        self.origen = None
+        self.consultas_rest = 0
+        self.lecturas = 0
+        self.oyentes = []
+        self._bloqueo = Lock()
+        self._refresco = Lock()
+        self._detener = Event()
+        self.trabajador = Thread(target=self._sondear)
+        self.trabajador.daemon = True
+
+    def suscribir(self, callback):
+        # callback(instantanea): {'total', 'disponible', 'origen'} cuando alguno cambia
+        self.oyentes.append(callback)
+
+    def iniciar(self):
+        try:
+            self.refrescar()
+        except Exception as e:
+            logging.error(f"Error en la carga inicial del balance: {e}")
+        self.trabajador.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def _sondear(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.refrescar()
+            except Exception as e:
+                logging.error(f"Error al sondear el balance: {e}")
+
+    def _guardar(self, total, disponible, origen):
+        with self._bloqueo:
+            cambio = (total, disponible) != (self.total, self.disponible)
+            self.total = total
+            self.disponible = disponible
+            self.actualizado = time.monotonic()
+            self.origen = origen
+        if not cambio:
+            return
+        for callback in self.oyentes:
+            try:
+                callback({'total': total, 'disponible': disponible, 'origen': origen})
+            except Exception as e:
+                logging.error(f"Error en oyente del balance: {e}")
+
+    def edad_ms(self):
+        actualizado = self.actualizado
+        return None if actualizado is None else (time.monotonic() - actualizado) * 1000
+
+    def refrescar(self, fresco_ms=None):
+        # Una sola consulta REST en vuelo: si otro hilo ya refrescó mientras se
+        # esperaba el candado y el dato cumple la frescura pedida, se reutiliza.
+        with self._refresco:
+            edad = self.edad_ms()
+            if fresco_ms is not None and edad is not None and edad <= fresco_ms:
+                return
+            self.registrar(self.consultar_balance())
+
+    def registrar(self, balance):
+        # Resultado de un fetch_balance hecho aquí o por el motor asyncio
+        self.consultas_rest += 1
+        activo = next((a for a in (balance.get('info') or {}).get('assets', []) if a.get('asset') == self.activo), None)
+        if activo is None:
+            # Respuesta sin el detalle de la cuenta de futuros
+            self._guardar(balance['total'][self.activo], balance['free'][self.activo], 'rest')
+            return
+        self._guardar(float(activo['walletBalance']), float(activo['availableBalance']), 'rest')
+
+    def instantanea(self, fresco_ms=None):
+        edad = self.edad_ms()
+        if edad is None or (fresco_ms is not None and edad > fresco_ms):
+            self.refrescar(fresco_ms)
+        self.lecturas += 1
+        with self._bloqueo:
+            return {
+                'total': self.total,
+                'disponible': self.disponible,
+                'edad_ms': round(self.edad_ms(), 1),
+                'origen': self.origen,
+            }
+
+    def al_cuenta(self, evento):
+        # ACCOUNT_UPDATE: {"a": {"B": [{"a": "USDT", "wb": wallet, "cw": cross wallet}]}}
+        # El evento no trae el margen disponible; se desplaza con el cambio de wallet
+        # y el siguiente sondeo REST lo deja exacto.
+        for b in evento.get('a', {}).get('B', []):
+            if b.get('a') != self.activo:
+                continue
+            total = float(b['wb'])
+            with self._bloqueo:
+                disponible = self.disponible
+                if disponible is not None and self.total is not None:
+                    disponible += total - self.total
+            self._guardar(total, disponible, 'stream')
+
+    def estado(self):
+        edad = self.edad_ms()
+        return {
+            'total': self.total,
+            'disponible': self.disponible,
+            'edad_ms': None if edad is None else round(edad, 1),
+            'origen': self.origen,
+            'frescura_ms': self.frescura_ms,
+            'consultas_rest': self.consultas_rest,
+            'lecturas': self.lecturas,
+        }
@@ -0,0 +1,151 @@
+import logging
+from collections import deque
+from itertools import count
+from threading import Thread, Condition
+
+# === COLA DE EJECUCIÓN DE SEÑALES ===
+# El webhook solo valida y encola; los trabajadores de esta cola ejecutan las
+# señales contra el exchange fuera del ciclo de la petición HTTP.
+#
+# Las señales se reparten en carriles según su clave (el símbolo). Cada carril es
+# FIFO estricto y nunca tiene más de una señal en ejecución, de modo que dos alertas
+# del mismo par no compiten en el "cerrar contraria y abrir"; carriles distintos se
+# ejecutan en paralelo entre los trabajadores disponibles.
+#
+# Con `coalescer` activo, una señal nueva para la que `anula(nueva)` es cierto
+# reemplaza a las señales de su carril que aún no han empezado: solo las que dejan
+# el mismo resultado se ejecuten o no las anteriores (ver senales.anula_pendientes;
+# sin `anula`, cualquiera). Las reemplazadas se entregan a
+# `al_reemplazar(reemplazadas, nueva)`.
+
+POLITICAS = ('descartar_antiguo', 'rechazar')
+
+class ColaEjecucion:
+    def __init__(self, funcion, clave, capacidad=100, trabajadores=2, politica='descartar_antiguo',
+                 coalescer=False, al_reemplazar=None, anula=None):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de cola desconocida: {politica}. Usa una de {POLITICAS}.")
+        self.funcion = funcion
+        self.clave = clave
+        self.capacidad = capacidad
+        self.politica = politica
+        self.coalescer = coalescer
+        self.al_reemplazar = al_reemplazar
+        self.anula = anula
+        self.carriles = {}
+        self.listos = deque()
+        self.activos = set()
+        self.pendientes = 0
+        self._secuencia = count()
+        self.condicion = Condition()
+        self.encoladas = 0
+        self.procesadas = 0
+        self.fallidas = 0
+        self.descartadas = 0
+        self.rechazadas = 0
+        self.reemplazadas = 0
+        self.trabajadores = [Thread(target=self._trabajar, daemon=True) for _ in range(trabajadores)]
+        for trabajador in self.trabajadores:
+            trabajador.start()
+
+    def encolar(self, elemento):
+        clave = self.clave(elemento)
+        reemplazadas = []
+        with self.condicion:
+            carril = self.carriles.get(clave)
+            if self.coalescer and carril and (self.anula is None or self.anula(elemento)):
+                reemplazadas = [pendiente for _, pendiente in carril]
+                carril.clear()
+                self.pendientes -= len(reemplazadas)
+                self.reemplazadas += len(reemplazadas)
+                # El carril queda vacío pero sigue en `listos`: se saca para no duplicarlo
+                if clave not in self.activos:
+                    self.listos.remove(clave)
+
+            if self.pendientes >= self.capacidad:
+                if self.politica == 'rechazar':
+                    self.rechazadas += 1
+                    logging.warning(f"Cola de ejecución llena ({self.capacidad}). Señal rechazada: {elemento}")
+                    return False
+                descartado = self._descartar_mas_antiguo(clave)
+                self.descartadas += 1
+                logging.warning(f"Cola de ejecución llena ({self.capacidad}). Señal más antigua descartada: {descartado}")
+
+            carril = self.carriles.setdefault(clave, deque())
+            if not carril and clave not in self.activos:
+                self.listos.append(clave)
+            carril.append((next(self._secuencia), elemento))
+            self.pendientes += 1
+            self.encoladas += 1
+            self.condicion.notify()
+
+        if reemplazadas:
+            logging.info(f"{len(reemplazadas)} señal(es) de {clave} reemplazadas por {elemento}.")
+            if self.al_reemplazar:
+                try:
+                    self.al_reemplazar(reemplazadas, elemento)
+                except Exception as e:
+                    logging.error(f"Error al registrar señales reemplazadas de {clave}: {e}")
+        return True
+
+    def _descartar_mas_antiguo(self, clave):
+        # Se prefiere descartar del mismo carril: la señal nueva del par deja obsoleta
+        # a la más antigua. Si el carril está vacío, cae la más antigua de toda la cola.
+        if not self.carriles.get(clave):
+            clave = min((c for c, carril in self.carriles.items() if carril),
+                        key=lambda c: self.carriles[c][0][0])
+        carril = self.carriles[clave]
+        _, descartado = carril.popleft()
+        self.pendientes -= 1
+        if not carril and clave not in self.activos:
+            self.listos.remove(clave)
+            del self.carriles[clave]
+        return descartado
+
+    def profundidad(self):
+        return self.pendientes
+
+    def estado(self):
+        with self.condicion:
+            return {
+                'profundidad': self.pendientes,
+                'capacidad': self.capacidad,
+                'politica': self.politica,
+                'trabajadores': len(self.trabajadores),
+                'en_curso': len(self.activos),
+                'carriles': {clave: len(carril) for clave, carril in self.carriles.items()},
+                'encoladas': self.encoladas,
+                'procesadas': self.procesadas,
+                'fallidas': self.fallidas,
+                'descartadas': self.descartadas,
+                'rechazadas': self.rechazadas,
+                'coalescer': self.coalescer,
+                'reemplazadas': self.reemplazadas,
+            }
+
+    def _trabajar(self):
+        while True:
+            with self.condicion:
+                while not self.listos:
+                    self.condicion.wait()
+                clave = self.listos.popleft()
+                _, elemento = self.carriles[clave].popleft()
+                self.pendientes -= 1
+                self.activos.add(clave)
+            try:
+                self.funcion(elemento)
+                exito = True
+            except Exception as e:
+                exito = False
+                logging.error(f"Error al ejecutar señal encolada {elemento}: {e}")
+            with self.condicion:
+                self.activos.discard(clave)
+                if self.carriles[clave]:
+                    self.listos.append(clave)
+                    self.condicion.notify()
+                else:
+                    del self.carriles[clave]
+                if exito:
+                    self.procesadas += 1
+                else:
+                    self.fallidas += 1
@@ -0,0 +1,36 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+
+import trading_bot
+from trading_bot import motor, obtener_balance_futuros
+
+# === DASHBOARD STREAMLIT: streamlit run dashboard.py ===
+# Vive aparte del motor para que streamlit, pandas y plotly solo se carguen aquí:
+# app.py y los workers de gunicorn que sirven /webhook no los importan (ver
+# importaciones.py). Solo lee: arranca el cliente ccxt y el balance, no el motor
+# (sin streams, escritor ni colas que dupliquen lo que hace el proceso de la app).
+
+def mostrar_dashboard():
+    st.title("Dashboard de Trading")
+    # Streamlit vuelve a ejecutar el script en cada interacción; iniciar_lectura() solo construye una vez
+    if not motor.iniciar_lectura():
+        st.error(f"Motor de trading no disponible: {motor.error}")
+        return
+    try:
+        balance = obtener_balance_futuros()
+        st.metric("Balance Actual (USDT)", balance)
+
+        posiciones = trading_bot.exchange.fapiPrivate_get_positionrisk()
+        df_posiciones = pd.DataFrame(posiciones)
+        st.write("Posiciones Actuales:")
+        st.dataframe(df_posiciones[["symbol", "positionAmt", "entryPrice"]])
+
+        fig = px.pie(df_posiciones, values='positionAmt', names='symbol', title="Distribución de Posiciones")
+        st.plotly_chart(fig)
+    except Exception as e:
+        st.error(f"Error al mostrar el dashboard: {e}")
+
+# === EJECUCIÓN PRINCIPAL ===
+if __name__ == "__main__":
+    mostrar_dashboard()
@@ -0,0 +1,136 @@
+import logging
+
+from mercados import construir_orden_lote
+
+# === PASOS COMUNES DE EJECUCIÓN ===
+# Lo que hace una señal entre las lecturas y el envío de órdenes, sin E/S: precios
+# límite, tamaño, qué hacer con una posición contraria, ids de cliente, contabilidad
+# de cada orden en el registro y aviso cuando una falla. El motor por hilos
+# (trading_bot) y el motor asyncio (motor_async) llaman a lo mismo y solo difieren
+# en cómo esperan al exchange.
+
+def precio_para_orden(bid, ask, direccion, porcentaje_limite):
+    if direccion == 'buy':
+        return bid * (1 - porcentaje_limite)
+    elif direccion == 'sell':
+        return ask * (1 + porcentaje_limite)
+
+def precio_para_cierre(bid, ask, direccion):
+    if direccion == 'sell':
+        return bid * 0.99
+    elif direccion == 'buy':
+        return ask * 1.01
+
+def direccion_cierre(cantidad_abierta):
+    return 'sell' if cantidad_abierta > 0 else 'buy'
+
+def cantidad_en_posiciones(posiciones, simbolo):
+    # Cantidad con signo de un símbolo en la respuesta de positionRisk
+    posicion = next((p for p in posiciones if p['symbol'] == simbolo.replace('/', '') and float(p['positionAmt']) != 0), None)
+    return float(posicion['positionAmt']) if posicion else 0.0
+
+def calcular_tamano_operacion(balance, porcentaje, apalancamiento, min_tamano, max_tamano, step_size):
+    tamano = balance * (porcentaje / 100) * apalancamiento
+    tamano = max(min_tamano, min(tamano, max_tamano))
+    tamano = round(tamano / step_size) * step_size
+    return tamano
+
+def patas_volteo(cantidad_abierta, precio_cierre, direccion, cantidad, precio, id_cierre=None, id_entrada=None):
+    # Cierre reduce-only de la posición contraria y nueva entrada, en ese orden
+    return [
+        ("cierre_límite", direccion_cierre(cantidad_abierta), abs(cantidad_abierta), precio_cierre, True, id_cierre),
+        ("límite", direccion, cantidad, precio, False, id_entrada),
+    ]
+
+class PasosEjecucion:
+    def __init__(self, config, indice_mercados, registro_ordenes, log_orden, notificar=None):
+        self.config = config
+        self.indice_mercados = indice_mercados
+        self.registro_ordenes = registro_ordenes
+        self.log_orden = log_orden
+        self.notificar = notificar
+
+    # --- Decisiones de una señal ---
+    def ids(self, senal):
+        # (id_cierre, id_entrada) de la señal
+        return (self.registro_ordenes.nuevo_id(senal, "cierre_límite"),
+                self.registro_ordenes.nuevo_id(senal, "límite"))
+
+    def plan(self, senal, cantidad_abierta):
+        # (cerrar_antes, voltear) ante la posición abierta del símbolo. Con
+        # 'flip_atomico' una posición contraria se cierra en el mismo lote que la
+        # nueva entrada; sin él, o si la señal es de cierre, se cierra antes.
+        if not cantidad_abierta or direccion_cierre(cantidad_abierta) != senal.accion:
+            return False, False
+        if senal.posicion_final != 0 and self.config.get('flip_atomico', True):
+            print(f"Posición contraria detectada en {senal.ticker}. Se cerrará y abrirá en un único lote.")
+            return False, True
+        print(f"Posición contraria detectada en {senal.ticker}. Cerrando posición abierta antes de continuar.")
+        return True, False
+
+    def step_size(self, simbolo):
+        filtros = self.indice_mercados.obtener(simbolo)
+        if filtros and filtros['step_size']:
+            return filtros['step_size']
+        logging.error(f"Step size para {simbolo} no encontrado.")
+        return 0.01  # Valor por defecto si falta
+
+    def tamano(self, balance, step_size):
+        return calcular_tamano_operacion(
+            balance,
+            self.config['porcentaje_operacion'],
+            self.config['apalancamiento'],
+            self.config['min_tamano'],
+            self.config['max_tamano'],
+            step_size
+        )
+
+    # --- Contabilidad de órdenes ---
+    def preparar(self, simbolo, direccion, cantidad, precio, tipo="límite", reduce_only=False, client_order_id=None):
+        # Registra la orden antes de enviarla y devuelve los params de create_order
+        params = {'reduceOnly': True} if reduce_only else {}
+        if client_order_id:
+            params['newClientOrderId'] = client_order_id
+            self.registro_ordenes.registrar(client_order_id, simbolo, direccion, cantidad, precio, tipo, reduce_only)
+        return params
+
+    def aceptada(self, simbolo, direccion, cantidad, precio, tipo, client_order_id, orden):
+        if client_order_id:
+            self.registro_ordenes.confirmar(client_order_id, orden)
+        self.log_orden(tipo, simbolo, direccion, cantidad, precio, orden)
+
+    def fallida(self, simbolo, direccion, cantidad, precio, tipo, client_order_id, error):
+        if client_order_id:
+            self.registro_ordenes.fallar(client_order_id, error)
+        logging.error(f"Error al enviar la orden límite: {error}")
+        if self.notificar:
+            self.notificar(f"Error al enviar la orden {tipo} {direccion.upper()} {cantidad} {simbolo} a {precio}: {error}", "error")
+
+    def preparar_lote(self, simbolo, patas):
+        # patas: [(tipo, direccion, cantidad, precio, reduce_only, client_order_id), ...]
+        # en orden de ejecución. Registra todas y devuelve el cuerpo de batchOrders, o
+        # None si no hay metadatos del mercado y deben ir una a una.
+        for tipo, direccion, cantidad, precio, reduce_only, client_order_id in patas:
+            if client_order_id:
+                self.registro_ordenes.registrar(client_order_id, simbolo, direccion, cantidad, precio, tipo, reduce_only)
+        filtros = self.indice_mercados.obtener(simbolo)
+        if not filtros:
+            logging.error(f"Sin metadatos de mercado para {simbolo}; se envían las órdenes por separado.")
+            return None
+        return [construir_orden_lote(filtros, *pata[1:]) for pata in patas]
+
+    def repartir_lote(self, simbolo, patas, respuestas):
+        # Confirma las patas que batchOrders aceptó y devuelve [(pata, orden o None)];
+        # las que quedan en None se reenvían una a una con create_order y el mismo
+        # client_order_id, así que una pata que sí entró no se duplica.
+        resultado = []
+        for pata, respuesta in zip(patas, respuestas or [None] * len(patas)):
+            tipo, direccion, cantidad, precio, reduce_only, client_order_id = pata
+            if respuesta and 'orderId' in respuesta:
+                self.aceptada(simbolo, direccion, cantidad, precio, tipo, client_order_id, respuesta)
+                resultado.append((pata, respuesta))
+                continue
+            if respuesta:
+                logging.error(f"Orden {tipo} rechazada dentro de batchOrders para {simbolo}: {respuesta}")
+            resultado.append((pata, None))
+        return resultado
@@ -0,0 +1,135 @@
+import json
+import time
+from collections import deque
+from datetime import datetime
+from itertools import count
+from threading import Condition
+
+# === BUS DE EVENTOS PARA EL DASHBOARD ===
+# El pipeline de ejecución publica aquí los cambios de órdenes, posiciones y balance
+# en cuanto ocurren; cada cliente SSE (/api/stream) lee del bus sin tocar la base de
+# datos ni el exchange. Los eventos llevan un id creciente y se guardan los
+# `historial` últimos: un navegador que se reconecta con Last-Event-ID recibe lo que
+# se perdió, y si su id ya salió del historial se le envía 'resync' para que recargue
+# las tablas una vez.
+#
+# publicar() nunca bloquea al pipeline: solo añade al historial y despierta a los
+# lectores. Cada proceso (worker de gunicorn) tiene su propio bus y sus propios
+# clientes.
+
+RESYNC = 'resync'
+
+# Los datos de cada evento usan los mismos campos que /api/trades y /api/positions
+# para que el dashboard pinte las filas con el mismo código.
+
+def evento_orden(orden):
+    from persistencia import ESTADOS_TRADE
+
+    return {
+        'client_order_id': orden['client_order_id'],
+        'order_id': orden['order_id'],
+        'symbol': orden['simbolo'],
+        'side': orden['lado'],
+        'quantity': orden['cantidad'],
+        'price': orden['precio'],
+        'filled_quantity': orden['ejecutado'],
+        'avg_price': orden['precio_medio'],
+        'status': ESTADOS_TRADE[orden['estado']],
+        'created_at': datetime.utcfromtimestamp(orden['creada'] / 1000).isoformat(),
+        'error_message': orden['error'],
+    }
+
+def evento_posicion(simbolo, actual):
+    # positionRisk no llega por el stream: el precio de marca se deduce del PnL no
+    # realizado (pnl = (marca - entrada) * cantidad)
+    cantidad = actual['cantidad']
+    entrada = actual['precio_entrada']
+    pnl = actual['pnl_no_realizado']
+    return {
+        'symbol': simbolo,
+        'side': 'LONG' if cantidad > 0 else 'SHORT',
+        'size': abs(cantidad),
+        'entry_price': entrada,
+        'mark_price': entrada + pnl / cantidad if cantidad else entrada,
+        'pnl': pnl,
+        'percentage': pnl / (entrada * abs(cantidad)) * 100 if cantidad and entrada else 0.0,
+    }
+
+def evento_balance(instantanea):
+    return {
+        'total_wallet_balance': instantanea['total'],
+        'available_balance': instantanea['disponible'],
+        'origen': instantanea['origen'],
+    }
+
+def formatear_sse(evento):
+    id_evento, tipo, datos = evento
+    return f"id: {id_evento}\nevent: {tipo}\ndata: {json.dumps(datos, separators=(',', ':'), default=str)}\n\n"
+
+class BusEventos:
+    def __init__(self, historial=1000, latido=15, reintento_ms=3000):
+        self.latido = latido
+        self.reintento_ms = reintento_ms
+        self.eventos = deque(maxlen=historial)
+        self.condicion = Condition()
+        self.secuencia = count(1)
+        self.ultimo_id = 0
+        self.publicados = 0
+        self.clientes = 0
+        self.resyncs = 0
+
+    def publicar(self, tipo, datos):
+        with self.condicion:
+            self.ultimo_id = next(self.secuencia)
+            self.eventos.append((self.ultimo_id, tipo, datos))
+            self.publicados += 1
+            self.condicion.notify_all()
+
+    def _pendientes(self, desde):
+        # Eventos con id > desde; None si el hueco ya no está en el historial o el id
+        # viene de otro proceso (reinicio, otro worker)
+        if desde > self.ultimo_id:
+            return None
+        if desde == self.ultimo_id:
+            return []
+        if desde < self.eventos[0][0] - 1:
+            return None
+        return [e for e in self.eventos if e[0] > desde]
+
+    def escuchar(self, ultimo_id=None, detener=None):
+        # Generador de texto SSE para una conexión. Sin Last-Event-ID se empieza en el
+        # evento actual: la página ya cargó las tablas al abrir.
+        with self.condicion:
+            self.clientes += 1
+            visto = self.ultimo_id if ultimo_id is None else ultimo_id
+        try:
+            yield f"retry: {self.reintento_ms}\n\n"
+            while detener is None or not detener():
+                with self.condicion:
+                    limite = time.monotonic() + self.latido
+                    pendientes = self._pendientes(visto)
+                    while pendientes == [] and time.monotonic() < limite:
+                        self.condicion.wait(limite - time.monotonic())
+                        pendientes = self._pendientes(visto)
+                    if pendientes is None:
+                        self.resyncs += 1
+                        visto = self.ultimo_id
+                        pendientes = [(visto, RESYNC, {})]
+                if not pendientes:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield ": latido\n\n"
+                    continue
+                visto = pendientes[-1][0]
+                yield ''.join(formatear_sse(e) for e in pendientes)
+        finally:
+            with self.condicion:
+                self.clientes -= 1
+
+    def estado(self):
+        return {
+            'clientes': self.clientes,
+            'publicados': self.publicados,
+            'ultimo_id': self.ultimo_id,
+            'historial': len(self.eventos),
+            'resyncs': self.resyncs,
+        }
@@ -0,0 +1,105 @@
+import json
+import time
+import logging
+from threading import Thread, Event
+
+import websocket
+
+# === STREAM DE DATOS DE USUARIO (Binance Futures) ===
+# Abre un listenKey, lo mantiene vivo y reparte cada evento (ACCOUNT_UPDATE,
+# ORDER_TRADE_UPDATE, ...) a los suscriptores registrados para su tipo. En cada
+# conexión se emite además un evento sintético {'e': 'CONEXION'} para que los
+# suscriptores puedan resincronizar lo que se hubiera perdido mientras tanto.
+
+EVENTO_CONEXION = 'CONEXION'
+
+class FlujoUsuario:
+    def __init__(self, exchange, url_base, intervalo_keepalive=1800, espera_maxima=30):
+        self.exchange = exchange
+        self.url_base = url_base.rstrip('/')
+        self.intervalo_keepalive = intervalo_keepalive
+        self.espera_maxima = espera_maxima
+        self.suscriptores = {}
+        self.listen_key = None
+        self.eventos = 0
+        self.reconexiones = 0
+        self.ws = None
+        self._detener = Event()
+        self.trabajador = Thread(target=self._escuchar)
+        self.trabajador.daemon = True
+        self.keepalive = Thread(target=self._mantener_listen_key)
+        self.keepalive.daemon = True
+
+    def suscribir(self, tipo_evento, callback):
+        self.suscriptores.setdefault(tipo_evento, []).append(callback)
+
+    def iniciar(self):
+        self.trabajador.start()
+        self.keepalive.start()
+
+    def detener(self):
+        self._detener.set()
+        if self.ws:
+            self.ws.close()
+
+    def _nuevo_listen_key(self):
+        self.listen_key = self.exchange.fapiPrivatePostListenKey()['listenKey']
+        return self.listen_key
+
+    def _mantener_listen_key(self):
+        while not self._detener.wait(self.intervalo_keepalive):
+            if not self.listen_key:
+                continue
+            try:
+                self.exchange.fapiPrivatePutListenKey({'listenKey': self.listen_key})
+            except Exception as e:
+                logging.error(f"Error al renovar el listenKey: {e}")
+
+    def _escuchar(self):
+        espera = 1
+        while not self._detener.is_set():
+            inicio = time.monotonic()
+            try:
+                listen_key = self._nuevo_listen_key()
+                self.ws = websocket.WebSocketApp(
+                    f"{self.url_base}/ws/{listen_key}",
+                    on_open=lambda ws: self._despachar({'e': EVENTO_CONEXION}),
+                    on_message=self._al_mensaje,
+                    on_error=lambda ws, error: logging.error(f"Error en stream de usuario: {error}")
+                )
+                self.ws.run_forever(ping_interval=60, ping_timeout=10)
+            except Exception as e:
+                logging.error(f"Error al abrir el stream de usuario: {e}")
+            if self._detener.is_set():
+                break
+            espera = 1 if time.monotonic() - inicio > 60 else min(espera * 2, self.espera_maxima)
+            self.reconexiones += 1
+            logging.warning(f"Stream de usuario desconectado. Reintentando en {espera} s.")
+            self._detener.wait(espera)
+
+    def _al_mensaje(self, ws, mensaje):
+        try:
+            evento = json.loads(mensaje)
+        except ValueError as e:
+            logging.error(f"Mensaje de stream de usuario no válido ({mensaje!r}): {e}")
+            return
+        self.eventos += 1
+        if evento.get('e') == 'listenKeyExpired':
+            logging.warning("listenKey caducado; se reabre el stream de usuario.")
+            ws.close()
+            return
+        self._despachar(evento)
+
+    def _despachar(self, evento):
+        for callback in self.suscriptores.get(evento.get('e'), []):
+            try:
+                callback(evento)
+            except Exception as e:
+                logging.error(f"Error al procesar evento {evento.get('e')} del stream de usuario: {e}")
+
+    def estado(self):
+        return {
+            'conectado': bool(self.ws and self.ws.sock and self.ws.sock.connected),
+            'eventos': self.eventos,
+            'reconexiones': self.reconexiones,
+        }
@@ -0,0 +1,132 @@
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+
+# === IDEMPOTENCIA DE WEBHOOKS ===
+# TradingView reintenta webhooks y a veces dispara la misma alerta dos veces. Cada
+# señal se identifica con un hash del mensaje más el id o timestamp de la alerta,
+# y se "reclama" antes de cualquier E/S con el exchange: si la clave ya se vio
+# dentro del TTL, la señal es un duplicado. El conjunto de vistos es un LRU acotado
+# en memoria; con varios workers de gunicorn se puede respaldar además en una tabla
+# (ProcessedSignal) cuya restricción UNIQUE hace de árbitro entre procesos.
+#
+# Sin id ni timestamp la clave es solo el texto, y dos señales legítimas iguales
+# (p. ej. dos "buy ETH" seguidos) serían indistinguibles de un reintento. Por eso
+# esas claves duran `ttl_sin_id` segundos (lo que tarda TradingView en reintentar o
+# duplicar un disparo), no `ttl`. Para tener la protección larga, la alerta debe
+# incluir su instante, p. ej. en JSON: {"action": "buy", ..., "time": "{{timenow}}"}.
+
+CAMPOS_ID_ALERTA = ('alert_id', 'id', 'timestamp', 'time', 'timenow')
+
+def id_alerta(datos):
+    # Id o timestamp de la alerta, '' si no trae ninguno
+    return next((str(datos[c]) for c in CAMPOS_ID_ALERTA if datos.get(c) not in (None, '')), '')
+
+def clave_senal(mensaje, datos):
+    identificador = id_alerta(datos)
+    if not isinstance(mensaje, str):
+        mensaje = json.dumps(mensaje, sort_keys=True, default=str)
+    return hashlib.sha256(f"{mensaje}|{identificador}".encode('utf-8')).hexdigest()
+
+def reclamar_clave_en_bd(clave, ttl):
+    # Import diferido: el registro se construye antes de que exista la app Flask
+    from sqlalchemy.exc import IntegrityError
+    from app import db
+    from models import ProcessedSignal
+
+    ahora = datetime.utcnow()
+    try:
+        db.session.add(ProcessedSignal(signal_key=clave, created_at=ahora))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+    # La clave existe: solo se puede reclamar de nuevo si ya caducó
+    renovadas = ProcessedSignal.query.filter(
+        ProcessedSignal.signal_key == clave,
+        ProcessedSignal.created_at < ahora - timedelta(seconds=ttl)
+    ).update({ProcessedSignal.created_at: ahora}, synchronize_session=False)
+    db.session.commit()
+    return renovadas == 1
+
+def liberar_clave_en_bd(clave):
+    from app import db
+    from models import ProcessedSignal
+
+    ProcessedSignal.query.filter_by(signal_key=clave).delete(synchronize_session=False)
+    db.session.commit()
+
+def purgar_claves_en_bd(ttl):
+    from app import db
+    from models import ProcessedSignal
+
+    ProcessedSignal.query.filter(
+        ProcessedSignal.created_at < datetime.utcnow() - timedelta(seconds=ttl)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+class RegistroIdempotencia:
+    def __init__(self, ttl=300, capacidad=10000, persistente=False, purgar_cada=500, ttl_sin_id=15):
+        self.ttl = ttl
+        self.ttl_sin_id = ttl_sin_id
+        self.capacidad = capacidad
+        self.persistente = persistente
+        self.purgar_cada = purgar_cada
+        self.vistos = OrderedDict()
+        self.consultas = 0
+        self.duplicados = 0
+        self._bloqueo = Lock()
+
+    def reclamar(self, clave, con_id=True):
+        # True si la señal es nueva (y queda reclamada); False si es un duplicado
+        ttl = self.ttl if con_id else self.ttl_sin_id
+        ahora = time.monotonic()
+        with self._bloqueo:
+            self.consultas += 1
+            expira = self.vistos.get(clave)
+            if expira is not None and expira > ahora:
+                self.duplicados += 1
+                return False
+            self.vistos[clave] = ahora + ttl
+            self.vistos.move_to_end(clave)
+            while len(self.vistos) > self.capacidad:
+                self.vistos.popitem(last=False)
+
+        if self.persistente:
+            try:
+                if self.consultas % self.purgar_cada == 0:
+                    purgar_claves_en_bd(self.ttl)
+                if not reclamar_clave_en_bd(clave, ttl):
+                    with self._bloqueo:
+                        self.duplicados += 1
+                    return False
+            except Exception as e:
+                # Sin base de datos se sigue con la protección en memoria del proceso
+                logging.error(f"Error al registrar la señal en la tabla de idempotencia: {e}")
+        return True
+
+    def liberar(self, clave):
+        # La señal reclamada no llegó a encolarse: un reintento debe poder pasar
+        with self._bloqueo:
+            self.vistos.pop(clave, None)
+        if self.persistente:
+            try:
+                liberar_clave_en_bd(clave)
+            except Exception as e:
+                logging.error(f"Error al liberar la señal en la tabla de idempotencia: {e}")
+
+    def estado(self):
+        return {
+            'ttl': self.ttl,
+            'ttl_sin_id': self.ttl_sin_id,
+            'claves': len(self.vistos),
+            'capacidad': self.capacidad,
+            'persistente': self.persistente,
+            'consultas': self.consultas,
+            'duplicados': self.duplicados,
+            'tasa_duplicados': round(self.duplicados / self.consultas, 4) if self.consultas else 0.0,
+        }
@@ -0,0 +1,56 @@
+import os
+import re
+import sys
+import subprocess
+
+# === COMPROBACIÓN DEL TIEMPO DE IMPORTACIÓN: python importaciones.py [módulo] ===
+# Importa el módulo (por defecto app, lo que carga cada worker de gunicorn) en un
+# intérprete limpio con `python -X importtime` y falla si entre lo importado aparece
+# alguna dependencia pesada que solo necesita el dashboard o la analítica, o si la
+# importación supera LIMITE_IMPORTACION_MS. Necesita el mismo entorno que la app.
+
+MODULOS_PESADOS = ('streamlit', 'pandas', 'numpy', 'plotly', 'pyarrow', 'matplotlib')
+LIMITE_MS = int(os.environ.get('LIMITE_IMPORTACION_MS', 2000))
+
+LINEA = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def medir_importacion(modulo='app'):
+    # Devuelve {'total_ms', 'pesados', 'mas_lentos'} de importar `modulo`
+    # El directorio de trabajo es el del llamante (config.json se busca ahí)
+    entorno = dict(os.environ)
+    entorno['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), entorno.get('PYTHONPATH')]))
+    salida = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {modulo}"],
+        capture_output=True, text=True, env=entorno,
+    )
+    if salida.returncode != 0:
+        error = '\n'.join(l for l in salida.stderr.splitlines() if not l.startswith('import time:'))
+        raise RuntimeError(f"No se pudo importar {modulo}:\n{error[-2000:]}")
+    tiempos = {}
+    for linea in salida.stderr.splitlines():
+        encontrada = LINEA.match(linea)
+        if encontrada:
+            propio, acumulado, _, nombre = encontrada.groups()
+            tiempos[nombre] = (int(propio) / 1000, int(acumulado) / 1000)
+    pesados = sorted({n.split('.')[0] for n in tiempos} & set(MODULOS_PESADOS))
+    mas_lentos = sorted(tiempos.items(), key=lambda t: t[1][0], reverse=True)[:10]
+    return {
+        'total_ms': tiempos.get(modulo, (0, 0))[1],
+        'pesados': pesados,
+        'mas_lentos': [(n, round(propio, 1)) for n, (propio, _) in mas_lentos],
+    }
+
+if __name__ == "__main__":
+    modulo = sys.argv[1] if len(sys.argv) > 1 else 'app'
+    resultado = medir_importacion(modulo)
+    print(f"import {modulo}: {resultado['total_ms']:.0f} ms (límite {LIMITE_MS} ms)")
+    for nombre, propio in resultado['mas_lentos']:
+        print(f"  {propio:8.1f} ms  {nombre}")
+    fallos = []
+    if resultado['pesados']:
+        fallos.append(f"importa dependencias pesadas: {', '.join(resultado['pesados'])}")
+    if resultado['total_ms'] > LIMITE_MS:
+        fallos.append(f"supera el límite de {LIMITE_MS} ms")
+    for fallo in fallos:
+        print(f"FALLO: {fallo}")
+    sys.exit(1 if fallos else 0)
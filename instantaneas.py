@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+
+# === CACHÉ COMPARTIDA DE INSTANTÁNEAS DEL EXCHANGE ===
+# Las páginas y la API del dashboard (/, /api/positions, /api/balance,
+# /api/test-connection) no llaman al exchange por cada petición: leen una
+# instantánea de como mucho `ttl` segundos guardada en un SQLite local que
+# comparten todos los workers de gunicorn de la máquina.
+#
+# Cuando la instantánea caduca, solo una petición la recarga (single-flight): dentro
+# del proceso con un candado por clave, y entre procesos con una reserva en la
+# propia fila tomada con BEGIN IMMEDIATE. El resto espera a que aparezca el dato
+# nuevo; si la reserva vence (el dueño murió o tarda más de `espera_maxima`), otro
+# la toma. Si la recarga falla y hay una instantánea anterior, se sirve esa con su
+# edad real.
+#
+# obtener() devuelve (valor, edad en segundos) para que cada respuesta diga de
+# cuándo es el dato. Los valores se guardan como JSON.
+
+RUTA_POR_DEFECTO = os.path.join(tempfile.gettempdir(), 'trading_bot_instantaneas.db')
+
+class CacheInstantaneas:
+    def __init__(self, ruta=None, ttl=5.0, espera_maxima=10.0, sondeo=0.05):
+        self.ruta = ruta or os.environ.get('INSTANTANEAS_DB', RUTA_POR_DEFECTO)
+        self.ttl = ttl
+        self.espera_maxima = espera_maxima
+        self.sondeo = sondeo
+        self.aciertos = 0
+        self.cargas = 0
+        self.esperas = 0
+        self.errores = 0
+        self._local = threading.local()
+        self._candados = {}
+        self._bloqueo = threading.Lock()
+
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        # Una conexión heredada de un fork (gunicorn --preload) no se reutiliza
+        if conexion is None or self._local.pid != os.getpid():
+            # Autocommit: las transacciones se abren a mano con BEGIN IMMEDIATE
+            conexion = sqlite3.connect(self.ruta, timeout=self.espera_maxima, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS instantaneas ("
+                "clave TEXT PRIMARY KEY, valor TEXT, creado REAL, reserva REAL, dueno TEXT)"
+            )
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def _candado(self, clave):
+        with self._bloqueo:
+            return self._candados.setdefault(clave, threading.Lock())
+
+    def _leer(self, conexion, clave):
+        return conexion.execute(
+            "SELECT valor, creado, reserva FROM instantaneas WHERE clave = ?", (clave,)
+        ).fetchone()
+
+    @staticmethod
+    def _fresca(fila, ttl, ahora):
+        return fila is not None and fila[0] is not None and ahora - fila[1] < ttl
+
+    def obtener(self, clave, cargar, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        conexion = self._conexion()
+        fila = self._leer(conexion, clave)
+        if self._fresca(fila, ttl, time.time()):
+            self.aciertos += 1
+            return json.loads(fila[0]), time.time() - fila[1]
+
+        with self._candado(clave):
+            limite = time.time() + self.espera_maxima
+            while True:
+                conexion.execute("BEGIN IMMEDIATE")
+                try:
+                    fila = self._leer(conexion, clave)
+                    ahora = time.time()
+                    if self._fresca(fila, ttl, ahora):
+                        self.aciertos += 1
+                        return json.loads(fila[0]), ahora - fila[1]
+                    if fila is not None and fila[2] and fila[2] > ahora and ahora < limite:
+                        # Otro worker está recargando esta clave
+                        esperar = True
+                    else:
+                        esperar = False
+                        conexion.execute(
+                            "INSERT INTO instantaneas (clave, reserva, dueno) VALUES (?, ?, ?) "
+                            "ON CONFLICT(clave) DO UPDATE SET reserva = excluded.reserva, dueno = excluded.dueno",
+                            (clave, ahora + self.espera_maxima, f"{os.getpid()}:{threading.get_ident()}")
+                        )
+                finally:
+                    conexion.execute("COMMIT")
+                if not esperar:
+                    break
+                self.esperas += 1
+                time.sleep(self.sondeo)
+
+            try:
+                valor = cargar()
+            except Exception as e:
+                conexion.execute("UPDATE instantaneas SET reserva = NULL WHERE clave = ?", (clave,))
+                if fila is None or fila[0] is None:
+                    raise
+                self.errores += 1
+                logging.warning(f"No se pudo recargar la instantánea '{clave}', se sirve la anterior: {e}")
+                return json.loads(fila[0]), time.time() - fila[1]
+
+            texto = json.dumps(valor, default=str)
+            conexion.execute(
+                "UPDATE instantaneas SET valor = ?, creado = ?, reserva = NULL WHERE clave = ?",
+                (texto, time.time(), clave)
+            )
+            self.cargas += 1
+            # Mismo valor que verán los demás workers al leerlo de la caché
+            return json.loads(texto), 0.0
+
+    def invalidar(self, clave=None):
+        conexion = self._conexion()
+        if clave is None:
+            conexion.execute("DELETE FROM instantaneas")
+        else:
+            conexion.execute("DELETE FROM instantaneas WHERE clave = ?", (clave,))
+
+    def estado(self):
+        return {
+            'ruta': self.ruta,
+            'ttl': self.ttl,
+            'aciertos': self.aciertos,
+            'cargas': self.cargas,
+            'esperas': self.esperas,
+            'errores': self.errores,
+        }
@@ -0,0 +1,98 @@
+import json
+import time
+import logging
+from threading import Thread, Event
+
+import websocket
+
+from mercados import normalizar_simbolo
+
+# === CACHÉ DEL MEJOR BID/ASK (bookTicker) ===
+# Se suscribe al stream combinado <simbolo>@bookTicker de Binance Futures y guarda
+# el mejor bid/ask de cada símbolo permitido. El precio de una orden límite pasa a
+# ser una lectura de diccionario; si la cotización es más vieja que `max_edad`
+# segundos, obtener() devuelve None y quien llama cae al fetch_ticker REST.
+# `url_base` es configurable para poder apuntar a un servidor de stream local.
+
+URL_FUTUROS = 'wss://fstream.binance.com'
+URL_FUTUROS_TESTNET = 'wss://stream.binancefuture.com'
+
+class CacheTopeLibro:
+    def __init__(self, simbolos, url_base=URL_FUTUROS, max_edad=2.0, espera_maxima=30):
+        self.simbolos = sorted({normalizar_simbolo(s) for s in simbolos})
+        self.url = f"{url_base.rstrip('/')}/stream?streams=" + '/'.join(f"{s.lower()}@bookTicker" for s in self.simbolos)
+        self.max_edad = max_edad
+        self.espera_maxima = espera_maxima
+        self.cotizaciones = {}
+        self.mensajes = 0
+        self.reconexiones = 0
+        self.aciertos = 0
+        self.caducadas = 0
+        self.ws = None
+        self._detener = Event()
+        self.trabajador = Thread(target=self._escuchar)
+        self.trabajador.daemon = True
+
+    def iniciar(self):
+        if not self.simbolos:
+            logging.warning("Caché bookTicker sin símbolos; se usará siempre fetch_ticker.")
+            return
+        self.trabajador.start()
+
+    def detener(self):
+        self._detener.set()
+        if self.ws:
+            self.ws.close()
+
+    def _escuchar(self):
+        espera = 1
+        while not self._detener.is_set():
+            inicio = time.monotonic()
+            self.ws = websocket.WebSocketApp(
+                self.url,
+                on_message=self._al_mensaje,
+                on_error=lambda ws, error: logging.error(f"Error en stream bookTicker: {error}")
+            )
+            self.ws.run_forever(ping_interval=60, ping_timeout=10)
+            if self._detener.is_set():
+                break
+            # Una conexión que duró un rato reinicia el backoff
+            espera = 1 if time.monotonic() - inicio > 60 else min(espera * 2, self.espera_maxima)
+            self.reconexiones += 1
+            logging.warning(f"Stream bookTicker desconectado. Reintentando en {espera} s.")
+            self._detener.wait(espera)
+
+    def _al_mensaje(self, ws, mensaje):
+        try:
+            datos = json.loads(mensaje)
+            # El stream combinado envuelve el evento en {"stream": ..., "data": {...}}
+            datos = datos.get('data', datos)
+            if datos.get('e', 'bookTicker') != 'bookTicker' or 's' not in datos:
+                return
+            self.cotizaciones[datos['s']] = (float(datos['b']), float(datos['a']), time.monotonic())
+            self.mensajes += 1
+        except Exception as e:
+            logging.error(f"Mensaje bookTicker no válido ({mensaje!r}): {e}")
+
+    def obtener(self, simbolo):
+        cotizacion = self.cotizaciones.get(normalizar_simbolo(simbolo))
+        if cotizacion is None:
+            return None
+        bid, ask, recibido = cotizacion
+        if time.monotonic() - recibido > self.max_edad:
+            self.caducadas += 1
+            return None
+        self.aciertos += 1
+        return bid, ask
+
+    def estado(self):
+        ahora = time.monotonic()
+        return {
+            'simbolos': self.simbolos,
+            'edad_cotizaciones': {s: round(ahora - c[2], 3) for s, c in self.cotizaciones.items()},
+            'max_edad': self.max_edad,
+            'mensajes': self.mensajes,
+            'aciertos': self.aciertos,
+            'caducadas': self.caducadas,
+            'reconexiones': self.reconexiones,
+        }
@@ -0,0 +1,173 @@
+import time
+import logging
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
+from threading import Thread, Lock, Event
+
+# === ÍNDICE DE METADATOS DE MERCADO ===
+# Mantiene en memoria los filtros de cada símbolo (step size, tick size, cantidades
+# mínima/máxima y notional mínimo) para no descargar fetch_markets() en cada señal.
+# Se alimenta de load_markets() del propio cliente: la primera carga reutiliza los
+# mercados que el cliente ya tenga (o los deja cargados para él) y los refrescos
+# periódicos recargan los dos a la vez, así que nunca hay una descarga aparte.
+# Cada entrada se indexa por el símbolo ccxt ('ETH/USDT') y por el símbolo crudo
+# de Binance ('ETHUSDT'), así que la búsqueda es O(1) con cualquiera de los dos.
+# fetch_markets() de Binance trae spot, USDⓈ-M y COIN-M con los mismos símbolos
+# base: solo se indexa el tipo de contrato que opera el cliente (defaultType
+# 'future' → lineales), para que 'ETHUSDT' no resuelva a los filtros de spot.
+
+def es_del_tipo(mercado, tipo):
+    # tipo: defaultType del cliente ccxt ('spot', 'future' = USDⓈ-M, 'delivery' = COIN-M)
+    if mercado.get('type') is None and mercado.get('linear') is None:
+        return True  # mercado sin metadatos de tipo: no hay con qué descartarlo
+    if tipo == 'spot':
+        return mercado.get('type') == 'spot'
+    if mercado.get('type') == 'spot' or mercado.get('spot'):
+        return False
+    if tipo == 'delivery':
+        return bool(mercado.get('inverse'))
+    return bool(mercado.get('linear'))
+
+def normalizar_simbolo(simbolo):
+    return simbolo.replace('/', '').split(':')[0].upper()
+
+def _a_float(valor, por_defecto=None):
+    try:
+        return float(valor) if valor is not None else por_defecto
+    except (TypeError, ValueError):
+        return por_defecto
+
+def extraer_filtros(mercado):
+    filtros = {f.get('filterType'): f for f in mercado.get('info', {}).get('filters', [])}
+    lote = filtros.get('LOT_SIZE', {})
+    precio = filtros.get('PRICE_FILTER', {})
+    notional = filtros.get('MIN_NOTIONAL', {})
+    limites = mercado.get('limits') or {}
+
+    return {
+        'symbol': mercado['symbol'],
+        'id': mercado.get('id') or normalizar_simbolo(mercado['symbol']),
+        'base': mercado.get('base'),
+        'quote': mercado.get('quote'),
+        'perpetuo': bool(mercado.get('swap')),
+        'step_size': _a_float(lote.get('stepSize'), _a_float((mercado.get('precision') or {}).get('amount'))),
+        'tick_size': _a_float(precio.get('tickSize'), _a_float((mercado.get('precision') or {}).get('price'))),
+        'min_qty': _a_float(lote.get('minQty'), _a_float((limites.get('amount') or {}).get('min'))),
+        'max_qty': _a_float(lote.get('maxQty'), _a_float((limites.get('amount') or {}).get('max'))),
+        # Futuros publica 'notional', spot publica 'minNotional'
+        'min_notional': _a_float(notional.get('notional', notional.get('minNotional')),
+                                 _a_float((limites.get('cost') or {}).get('min'))),
+    }
+
+class IndiceMercados:
+    def __init__(self, exchange, ttl=3600, al_actualizar=None, tipo=None):
+        self.exchange = exchange
+        self.tipo = tipo or (getattr(exchange, 'options', None) or {}).get('defaultType', 'future')
+        self.ttl = ttl
+        self.al_actualizar = al_actualizar
+        self.indice = {}
+        self.cargado_en = None
+        self._bloqueo = Lock()
+        self._detener = Event()
+        self.trabajador = Thread(target=self._refrescar_periodicamente)
+        self.trabajador.daemon = True
+
+    def cargar(self):
+        mercados = list(self.exchange.load_markets(reload=self.cargado_en is not None).values())
+        nuevo = {}
+        for mercado in mercados:
+            if not es_del_tipo(mercado, self.tipo):
+                continue
+            try:
+                filtros = extraer_filtros(mercado)
+            except Exception as e:
+                logging.debug(f"Mercado ignorado al indexar {mercado.get('symbol')}: {e}")
+                continue
+            # Los contratos lineales de ccxt usan 'ETH/USDT:USDT'; se indexan también
+            # como 'ETH/USDT' porque es el formato que llega en las señales. Si además
+            # hay futuros con vencimiento del mismo par, el perpetuo se queda esa clave.
+            nuevo[filtros['symbol']] = filtros
+            nuevo[normalizar_simbolo(filtros['id'])] = filtros
+            base = filtros['symbol'].split(':')[0]
+            if base not in nuevo or (mercado.get('swap') and not nuevo[base]['perpetuo']):
+                nuevo[base] = filtros
+
+        # Se sustituye el diccionario completo: los lectores nunca ven un índice a medias
+        with self._bloqueo:
+            self.indice = nuevo
+            self.cargado_en = time.time()
+        logging.info(f"Índice de mercados cargado: {len(mercados)} mercados.")
+
+        if self.al_actualizar:
+            try:
+                self.al_actualizar(self)
+            except Exception as e:
+                logging.error(f"Error al sincronizar metadatos de mercado: {e}")
+        return nuevo
+
+    def iniciar(self):
+        try:
+            self.cargar()
+        except Exception as e:
+            logging.error(f"Error en la carga inicial del índice de mercados: {e}")
+        self.trabajador.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def _refrescar_periodicamente(self):
+        while not self._detener.wait(self.ttl if self.cargado_en else min(self.ttl, 30)):
+            try:
+                self.cargar()
+            except Exception as e:
+                logging.error(f"Error al refrescar el índice de mercados: {e}")
+
+    def obtener(self, simbolo):
+        indice = self.indice
+        filtros = indice.get(simbolo)
+        if filtros is None:
+            filtros = indice.get(normalizar_simbolo(simbolo))
+        return filtros
+
+def formatear_a_paso(valor, paso, redondeo=ROUND_DOWN):
+    # La API cruda (p. ej. batchOrders) exige cantidades y precios múltiplos exactos
+    # del step/tick; ccxt solo los ajusta en create_order.
+    paso = Decimal(str(paso))
+    ajustado = (Decimal(str(valor)) / paso).to_integral_value(redondeo) * paso
+    return format(ajustado.normalize(), 'f')
+
+def construir_orden_lote(filtros, direccion, cantidad, precio, reduce_only=False, client_order_id=None):
+    orden = {
+        'symbol': filtros['id'],
+        'side': direccion.upper(),
+        'type': 'LIMIT',
+        'timeInForce': 'GTC',
+        'quantity': formatear_a_paso(cantidad, filtros['step_size']),
+        'price': formatear_a_paso(precio, filtros['tick_size'], ROUND_HALF_UP),
+    }
+    if reduce_only:
+        orden['reduceOnly'] = 'true'
+    if client_order_id:
+        orden['newClientOrderId'] = client_order_id
+    return orden
+
+def sincronizar_trading_pairs(indice):
+    # Import diferido: este módulo se usa desde el motor de ejecución, que no
+    # debe depender de que la aplicación Flask esté cargada.
+    from app import app, db
+    from models import TradingPair
+
+    with app.app_context():
+        pares = TradingPair.query.all()
+        cambios = 0
+        for par in pares:
+            filtros = indice.obtener(par.symbol)
+            if not filtros:
+                continue
+            for campo in ('min_qty', 'max_qty', 'step_size', 'tick_size'):
+                valor = filtros[campo]
+                if valor is not None and getattr(par, campo) != valor:
+                    setattr(par, campo, valor)
+                    cambios += 1
+        if cambios:
+            db.session.commit()
+            logging.info(f"TradingPair sincronizados con el exchange ({cambios} campos actualizados).")
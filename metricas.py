@@ -0,0 +1,45 @@
+import time
+from collections import deque
+from threading import Lock
+
+# === TIEMPOS POR ETAPA DEL PIPELINE DE SEÑALES ===
+# Guarda los tiempos (ms) de las últimas `maximo` señales y resume cada etapa
+# con media, p50, p95 y máximo para exponerlos en /estado.
+
+def medir(tiempos, etapa, funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    try:
+        return funcion(*args, **kwargs)
+    finally:
+        tiempos[etapa] = round((time.perf_counter() - inicio) * 1000, 2)
+
+def _percentil(valores, p):
+    return valores[min(len(valores) - 1, int(round(p * (len(valores) - 1))))]
+
+class RegistroTiempos:
+    def __init__(self, maximo=200):
+        self.muestras = deque(maxlen=maximo)
+        self._bloqueo = Lock()
+
+    def registrar(self, tiempos):
+        with self._bloqueo:
+            self.muestras.append(dict(tiempos))
+
+    def resumen(self):
+        with self._bloqueo:
+            muestras = list(self.muestras)
+        etapas = {}
+        for muestra in muestras:
+            for etapa, ms in muestra.items():
+                etapas.setdefault(etapa, []).append(ms)
+        resumen = {}
+        for etapa, valores in etapas.items():
+            valores.sort()
+            resumen[etapa] = {
+                'n': len(valores),
+                'media': round(sum(valores) / len(valores), 2),
+                'p50': _percentil(valores, 0.5),
+                'p95': _percentil(valores, 0.95),
+                'max': valores[-1],
+            }
+        return resumen
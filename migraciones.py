@@ -0,0 +1,134 @@
+import logging
+
+from sqlalchemy import inspect, text
+
+# === MIGRACIONES LIGERAS ===
+# db.create_all() crea las tablas que faltan pero no toca las existentes: las columnas
+# y los índices declarados después en models.py no llegarían a una base de datos ya
+# desplegada. migrar() añade con ALTER TABLE las columnas que falten (nullable, con
+# su default escalar) y crea, con checkfirst, todo índice del metadata que no exista.
+# Es idempotente y se ejecuta en cada arranque tras create_all().
+
+def _anadir_columnas(db):
+    inspector = inspect(db.engine)
+    for tabla in db.metadata.sorted_tables:
+        existentes = {c['name'] for c in inspector.get_columns(tabla.name)}
+        for columna in tabla.columns:
+            if columna.name in existentes:
+                continue
+            tipo = columna.type.compile(dialect=db.engine.dialect)
+            defecto = columna.default.arg if columna.default is not None and columna.default.is_scalar else None
+            sql = f"ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {tipo}"
+            if defecto is not None:
+                sql += f" DEFAULT {defecto!r}"
+            with db.engine.begin() as conexion:
+                conexion.execute(text(sql))
+            logging.info(f"Columna {tabla.name}.{columna.name} añadida.")
+
+def _cerrar_abiertas_duplicadas(db):
+    # ux_position_open_symbol admite una sola fila OPEN por símbolo; una base anterior
+    # al índice puede tener varias (dos workers que abrieron a la vez). Se conserva la
+    # más reciente de cada símbolo y las demás se cierran.
+    with db.engine.begin() as conexion:
+        cerradas = conexion.execute(text(
+            "UPDATE position SET status = 'CLOSED', closed_at = COALESCE(closed_at, updated_at, created_at) "
+            "WHERE status = 'OPEN' AND id NOT IN (SELECT MAX(id) FROM position WHERE status = 'OPEN' GROUP BY symbol)"
+        )).rowcount
+    if cerradas:
+        logging.warning(f"{cerradas} posiciones OPEN duplicadas cerradas antes de crear ux_position_open_symbol.")
+
+def migrar(db):
+    try:
+        _anadir_columnas(db)
+    except Exception as e:
+        logging.error(f"Error al añadir columnas nuevas: {e}")
+    try:
+        _cerrar_abiertas_duplicadas(db)
+    except Exception as e:
+        logging.error(f"Error al cerrar posiciones OPEN duplicadas: {e}")
+    for tabla in db.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            try:
+                indice.create(bind=db.engine, checkfirst=True)
+            except Exception as e:
+                # p. ej. filas duplicadas que impiden un índice único: se avisa y se sigue
+                logging.error(f"No se pudo crear el índice {indice.name} en {tabla.name}: {e}")
+
+# === COMPROBACIÓN DE PLANES: python migraciones.py ===
+# Rellena una base SQLite temporal con 1M trades y comprueba con EXPLAIN QUERY PLAN
+# que ninguna consulta del dashboard, la analítica o el escritor de cierres recorre
+# una tabla entera. Sale con código 1 si alguna lo hace. Necesita el mismo entorno
+# que la app (importa app y models).
+if __name__ == "__main__":
+    import os
+    import sys
+    import random
+    import tempfile
+    from datetime import datetime, timedelta
+
+    FILAS = int(os.environ.get('FILAS_TRADES', 1000000))
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'planes.db')}"
+
+    from app import app, db
+    from sqlalchemy import tuple_
+    from models import Trade, Position, TradingAnalytics, OrderSide, OrderStatus, PositionStatus
+    from analitica import consulta_cierres
+
+    simbolos = [f"SYM{i}USDT" for i in range(50)]
+    inicio = datetime.utcnow() - timedelta(days=365)
+
+    with app.app_context():
+        print(f"Insertando {FILAS} trades...")
+        conexion = db.engine.raw_connection()
+        conexion.executemany(
+            "INSERT INTO trade (symbol, side, order_type, quantity, status, client_order_id, created_at) "
+            "VALUES (?, 'BUY', 'LIMIT', 1.0, 'FILLED', ?, ?)",
+            ((random.choice(simbolos), f"tv-{i}", inicio + timedelta(seconds=i * 30)) for i in range(FILAS))
+        )
+        conexion.executemany(
+            "INSERT INTO position (symbol, side, quantity, status, close_price, closed_at, close_key, created_at) "
+            "VALUES (?, 'BUY', 1.0, ?, ?, ?, ?, ?)",
+            # Una fila OPEN por símbolo (ux_position_open_symbol); el resto, ciclos cerrados
+            ((simbolos[i], 'OPEN', None, None, None, inicio) if i < len(simbolos) else
+             (random.choice(simbolos), 'CLOSED', 1.0, inicio + timedelta(seconds=i * 300 + 60), f"c-{i}",
+              inicio + timedelta(seconds=i * 300)) for i in range(FILAS // 10))
+        )
+        conexion.commit()
+        conexion.close()
+        db.session.execute(text("ANALYZE"))
+
+        desde = datetime.utcnow() - timedelta(days=30)
+        consultas = {
+            'últimos trades': Trade.query.order_by(Trade.created_at.desc()).limit(50),
+            'página por cursor': Trade.query.filter(
+                tuple_(Trade.created_at, Trade.id) < tuple_(desde, FILAS // 2)).order_by(
+                Trade.created_at.desc(), Trade.id.desc()).limit(50),
+            'página por estado': Trade.query.filter(Trade.status == OrderStatus.FILLED).order_by(
+                Trade.created_at.desc(), Trade.id.desc()).limit(50),
+            'trades desde un id': Trade.query.filter(Trade.id > FILAS - 100).order_by(Trade.id).limit(50),
+            'trades por símbolo y fecha': Trade.query.filter(
+                Trade.symbol == 'SYM1USDT', Trade.created_at >= desde).order_by(Trade.created_at.desc()),
+            'trades por rango de fechas': Trade.query.filter(Trade.created_at >= desde),
+            'trade por client_order_id': Trade.query.filter(Trade.client_order_id.in_(['tv-1', 'tv-2'])),
+            'posiciones abiertas': Position.query.filter_by(status=PositionStatus.OPEN),
+            'posición abierta de un símbolo': Position.query.filter_by(status=PositionStatus.OPEN, symbol='SYM1USDT'),
+            'analytics por símbolo y fechas': TradingAnalytics.query.filter(
+                TradingAnalytics.symbol == 'SYM1USDT', TradingAnalytics.date >= desde.date()),
+            'cierres por ventana': consulta_cierres(desde, datetime.utcnow()),
+            'cierres de un símbolo': consulta_cierres(desde, None, 'SYM1USDT'),
+            'ciclo sin PnL de un cierre': Position.query.filter_by(
+                symbol='SYM1USDT', side=OrderSide.BUY, close_price=None).filter(
+                Position.created_at <= desde,
+                db.or_(Position.closed_at.is_(None), Position.closed_at >= desde)).order_by(Position.id.desc()).limit(1),
+            'cierres ya aplicados': Position.query.with_entities(Position.close_key).filter(
+                Position.close_key.in_(['c-1', 'c-2'])),
+        }
+
+        fallos = 0
+        for nombre, consulta in consultas.items():
+            sql = str(getattr(consulta, 'statement', consulta).compile(db.engine, compile_kwargs={'literal_binds': True}))
+            plan = [fila[-1] for fila in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+            escaneo = [paso for paso in plan if paso.startswith('SCAN') and 'USING' not in paso]
+            fallos += bool(escaneo)
+            print(f"{'FALLO' if escaneo else 'ok':<6} {nombre:<32} {' | '.join(plan)}")
+        sys.exit(1 if fallos else 0)
@@ -48,6 +48,15 @@ class Trade(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Dashboard: páginas de /api/trades por cursor (created_at, id), sin filtro o
+    # filtradas por símbolo o estado, y el upsert por client_order_id del escritor diferido
+    __table_args__ = (
+        db.Index('ix_trade_created_at_id', 'created_at', 'id'),
+        db.Index('ix_trade_symbol_created_at_id', 'symbol', 'created_at', 'id'),
+        db.Index('ix_trade_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_trade_client_order_id', 'client_order_id'),
+    )
+
 class Position(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     symbol = db.Column(db.String(20), nullable=False, default="ETHUSDC")
@@ -68,6 +77,23 @@ class Position(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Fill que cerró el ciclo (símbolo + trade id): cada cierre se aplica una sola vez
+    # aunque lo emitan varios procesos
+    close_key = db.Column(db.String(64))
+
+    # Posiciones abiertas (status) y la fila OPEN de un símbolo
+    __table_args__ = (
+        db.Index('ix_position_status_symbol', 'status', 'symbol'),
+        db.Index('ux_position_close_key', 'close_key', unique=True),
+        # Cierres por rango de fechas (analítica por ventana)
+        db.Index('ix_position_closed_at', 'closed_at'),
+        # Ciclo sin PnL de un símbolo y lado al escribir un cierre
+        db.Index('ix_position_symbol_side_close_price', 'symbol', 'side', 'close_price'),
+        # Una sola fila OPEN por símbolo aunque la escriban varios workers a la vez
+        db.Index('ux_position_open_symbol', 'symbol', unique=True,
+                 sqlite_where=db.text("status = 'OPEN'"), postgresql_where=db.text("status = 'OPEN'")),
+    )
+
 class BotSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     api_key = db.Column(db.String(255))
@@ -112,5 +138,21 @@ class TradingAnalytics(db.Model):
     avg_win = db.Column(db.Float, default=0.0)
     avg_loss = db.Column(db.Float, default=0.0)
     profit_factor = db.Column(db.Float, default=0.0)
+    # Acumuladores del rollup incremental (analitica.py): con ellos se recalculan las
+    # medias y el profit factor, y se combinan los drawdowns de varios días.
+    gross_profit = db.Column(db.Float, default=0.0)
+    gross_loss = db.Column(db.Float, default=0.0)
+    peak_pnl = db.Column(db.Float, default=0.0)
+    trough_pnl = db.Column(db.Float, default=0.0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Una fila por símbolo y día
+    __table_args__ = (
+        db.Index('uq_trading_analytics_symbol_date', 'symbol', 'date', unique=True),
+    )
+
+class ProcessedSignal(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    signal_key = db.Column(db.String(64), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,298 @@
+import json
+import time
+import asyncio
+import logging
+import traceback
+from threading import Thread, Lock
+
+import ccxt.async_support as ccxt_async
+
+from mercados import normalizar_simbolo
+from senales import anula_pendientes
+from ejecucion import precio_para_orden, precio_para_cierre, direccion_cierre, cantidad_en_posiciones, patas_volteo
+from metricas import medir
+
+# === MOTOR DE EJECUCIÓN ASYNCIO (ccxt.async_support) ===
+# Las funciones de ejecución de trading_bot sobre un cliente ccxt asíncrono. Las
+# decisiones y la contabilidad de órdenes son las de ejecucion.PasosEjecucion,
+# compartidas con el motor por hilos; aquí solo se esperan las llamadas al exchange.
+# Un único event loop en su propio hilo y un único cliente (una sola sesión HTTP)
+# atienden todas las señales en vuelo: ninguna ocupa un hilo bloqueado en un socket.
+# Flask entrega cada señal con enviar(), que vuelve de inmediato.
+#
+# Las cachés en memoria (índice de mercados, bookTicker, libro de posiciones y
+# balance) son las mismas que usa el motor por hilos; solo los fallbacks REST
+# pasan por el cliente asíncrono.
+
+async def _medir(tiempos, etapa, corrutina):
+    inicio = time.perf_counter()
+    try:
+        return await corrutina
+    finally:
+        tiempos[etapa] = round((time.perf_counter() - inicio) * 1000, 2)
+
+class MotorAsync:
+    def __init__(self, opciones_exchange, config, indice_mercados, libro_ordenes, libro_posiciones,
+                 servicio_balance, registro_tiempos, pasos, procesar_senal_tv, capacidad=1000, coalescer=False,
+                 al_reemplazar=None, listo=None, espera_arranque=30):
+        self.opciones_exchange = opciones_exchange
+        self.config = config
+        self.indice_mercados = indice_mercados
+        self.libro_ordenes = libro_ordenes
+        self.libro_posiciones = libro_posiciones
+        self.servicio_balance = servicio_balance
+        self.registro_tiempos = registro_tiempos
+        self.pasos = pasos
+        self.procesar_senal_tv = procesar_senal_tv
+        self.capacidad = capacidad
+        self.coalescer = coalescer
+        self.al_reemplazar = al_reemplazar
+        self.listo = listo
+        self.espera_arranque = espera_arranque
+        self.exchange = None
+        self.carriles = {}
+        self.esperando = {}
+        self.en_vuelo = 0
+        self.procesadas = 0
+        self.rechazadas = 0
+        self.reemplazadas = 0
+        self._bloqueo = Lock()
+        self.loop = asyncio.new_event_loop()
+        self.hilo = Thread(target=self._correr, name='motor-async')
+        self.hilo.daemon = True
+
+    def iniciar(self):
+        self.hilo.start()
+        asyncio.run_coroutine_threadsafe(self._crear_exchange(), self.loop).result()
+
+    def precalentar(self, mercados=None, monedas=None):
+        # Mercados y conexión HTTP del cliente asíncrono, antes de la primera señal. Si
+        # el cliente síncrono ya descargó los mercados se adoptan esos y solo se
+        # sincroniza la hora, que además abre la conexión.
+        if mercados:
+            asyncio.run_coroutine_threadsafe(self._adoptar_mercados(mercados, monedas), self.loop).result()
+        else:
+            asyncio.run_coroutine_threadsafe(self.exchange.load_markets(), self.loop).result()
+
+    async def _adoptar_mercados(self, mercados, monedas):
+        self.exchange.set_markets(mercados, monedas)
+        if self.exchange.options.get('adjustForTimeDifference'):
+            await self.exchange.load_time_difference()
+
+    def detener(self):
+        asyncio.run_coroutine_threadsafe(self.exchange.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _correr(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _crear_exchange(self):
+        self.exchange = ccxt_async.binance(self.opciones_exchange)
+        if self.config.get('sandbox_mode', False):
+            self.exchange.set_sandbox_mode(True)
+
+    # --- Entrada desde Flask (cualquier hilo) ---
+    def enviar(self, senal):
+        with self._bloqueo:
+            if self.en_vuelo >= self.capacidad:
+                self.rechazadas += 1
+                logging.warning(f"Motor asyncio saturado ({self.capacidad} señales en vuelo). Señal rechazada: {senal}")
+                return False
+            self.en_vuelo += 1
+        asyncio.run_coroutine_threadsafe(self._ejecutar_en_carril(senal), self.loop)
+        return True
+
+    async def _ejecutar_en_carril(self, senal):
+        # asyncio.Lock despierta a los que esperan en orden de llegada: FIFO por símbolo.
+        # Con coalescer, un cierre que espera turno deja sin efecto a las señales
+        # anteriores del mismo símbolo que aún no han empezado (senales.anula_pendientes).
+        clave = normalizar_simbolo(senal.ticker)
+        carril = self.carriles.setdefault(clave, asyncio.Lock())
+        esperando = self.esperando.setdefault(clave, [])
+        esperando.append(senal)
+        try:
+            async with carril:
+                esperando.remove(senal)
+                cierre = next((s for s in reversed(esperando) if anula_pendientes(s)), None) if self.coalescer else None
+                if cierre:
+                    self.reemplazadas += 1
+                    logging.info(f"Señal {senal} de {clave} reemplazada por {cierre}.")
+                    if self.al_reemplazar:
+                        self.al_reemplazar([senal], cierre)
+                    return
+                if self.listo is not None and not self.listo.is_set():
+                    # Señal llegada mientras el motor precalienta
+                    if not await asyncio.to_thread(self.listo.wait, self.espera_arranque):
+                        logging.error(f"Motor sin precalentar tras {self.espera_arranque} s; señal {senal} descartada.")
+                        return
+                await self.ejecutar_senal(senal)
+        finally:
+            with self._bloqueo:
+                self.en_vuelo -= 1
+                self.procesadas += 1
+
+    # --- Ejecución asíncrona (los pasos sin E/S están en ejecucion.py) ---
+    async def obtener_balance_futuros(self, fresco_ms=None):
+        if fresco_ms is None:
+            fresco_ms = self.servicio_balance.frescura_ms
+        edad = self.servicio_balance.edad_ms()
+        if edad is None or edad > fresco_ms:
+            self.servicio_balance.registrar(await self.exchange.fetch_balance({'type': 'future'}))
+        return self.servicio_balance.total
+
+    async def obtener_mejor_precio(self, simbolo):
+        cotizacion = self.libro_ordenes.obtener(simbolo)
+        if cotizacion is not None:
+            return cotizacion
+        ticker = await self.exchange.fetch_ticker(simbolo)
+        return ticker['bid'], ticker['ask']
+
+    async def obtener_precio_para_orden(self, simbolo, direccion, porcentaje_limite):
+        try:
+            bid, ask = await self.obtener_mejor_precio(simbolo)
+            return precio_para_orden(bid, ask, direccion, porcentaje_limite)
+        except Exception as e:
+            logging.error(f"Error al obtener el precio límite: {e}")
+            return None
+
+    async def obtener_precio_para_cierre(self, simbolo, direccion):
+        try:
+            bid, ask = await self.obtener_mejor_precio(simbolo)
+            return precio_para_cierre(bid, ask, direccion)
+        except Exception as e:
+            logging.error(f"Error al calcular el precio para cierre: {e}")
+            return None
+
+    async def obtener_cantidad_posicion(self, simbolo):
+        cantidad = self.libro_posiciones.cantidad(simbolo)
+        if cantidad is not None:
+            return cantidad
+        return cantidad_en_posiciones(await self.exchange.fapiPrivate_get_positionrisk(), simbolo)
+
+    async def enviar_orden_limite(self, simbolo, direccion, cantidad, precio, reduce_only=False, tipo="límite",
+                                  client_order_id=None):
+        params = self.pasos.preparar(simbolo, direccion, cantidad, precio, tipo, reduce_only, client_order_id)
+        try:
+            orden = await self.exchange.create_order(
+                symbol=simbolo,
+                type='limit',
+                side=direccion,
+                amount=cantidad,
+                price=precio,
+                params=params
+            )
+        except Exception as e:
+            self.pasos.fallida(simbolo, direccion, cantidad, precio, tipo, client_order_id, e)
+            return None
+        self.pasos.aceptada(simbolo, direccion, cantidad, precio, tipo, client_order_id, orden)
+        return orden
+
+    async def enviar_lote_ordenes(self, simbolo, patas):
+        respuestas = None
+        lote = self.pasos.preparar_lote(simbolo, patas)
+        if lote:
+            try:
+                respuestas = await self.exchange.fapiPrivatePostBatchOrders({'batchOrders': json.dumps(lote)})
+            except Exception as e:
+                logging.error(f"batchOrders rechazado para {simbolo}; se envían las órdenes por separado: {e}")
+        return [
+            orden or await self.enviar_orden_limite(simbolo, direccion, cantidad, precio, reduce_only, tipo, client_order_id)
+            for (tipo, direccion, cantidad, precio, reduce_only, client_order_id), orden
+            in self.pasos.repartir_lote(simbolo, patas, respuestas)
+        ]
+
+    async def voltear_posicion(self, simbolo, cantidad_abierta, direccion, cantidad, precio, id_cierre=None, id_entrada=None):
+        precio_cierre = await self.obtener_precio_para_cierre(simbolo, direccion_cierre(cantidad_abierta))
+        if precio_cierre is None:
+            print(f"No se pudo calcular el precio límite para cerrar la posición en {simbolo}.")
+            return None
+        return await self.enviar_lote_ordenes(simbolo, patas_volteo(cantidad_abierta, precio_cierre, direccion, cantidad,
+                                                                    precio, id_cierre, id_entrada))
+
+    async def cerrar_posicion_con_limite(self, simbolo, client_order_id=None):
+        try:
+            cantidad_posicion = await self.obtener_cantidad_posicion(simbolo)
+            if not cantidad_posicion:
+                print(f"No hay posiciones abiertas para {simbolo}.")
+                return
+
+            direccion = direccion_cierre(cantidad_posicion)
+            precio_limite = await self.obtener_precio_para_cierre(simbolo, direccion)
+            if precio_limite is None:
+                print(f"No se pudo calcular el precio límite para cerrar la posición en {simbolo}.")
+                return
+
+            orden = await self.enviar_orden_limite(simbolo, direccion, abs(cantidad_posicion), precio_limite,
+                                                   tipo="cierre_límite", client_order_id=client_order_id)
+            if orden:
+                print(f"Posición cerrada con orden límite para {simbolo}: {orden}")
+        except Exception as e:
+            logging.error(f"Error al cerrar posición con límite: {e}")
+
+    async def ejecutar_senal_tv(self, mensaje):
+        senal = self.procesar_senal_tv(mensaje)
+        if not senal:
+            return
+        await self.ejecutar_senal(senal)
+
+    async def ejecutar_senal(self, senal):
+        accion = senal.accion
+        ticker = senal.ticker
+        posicion_final = senal.posicion_final
+
+        print(f"Procesando señal: Acción: {accion}, Ticker: {ticker}, Posición estratégica: {posicion_final}")
+
+        id_cierre, id_entrada = self.pasos.ids(senal)
+
+        tiempos = {}
+        inicio = time.perf_counter()
+        try:
+            lecturas = [_medir(tiempos, 'posicion', self.obtener_cantidad_posicion(ticker))]
+            if posicion_final != 0:
+                lecturas += [
+                    _medir(tiempos, 'balance', self.obtener_balance_futuros()),
+                    _medir(tiempos, 'precio', self.obtener_precio_para_orden(ticker, accion, 0.001)),
+                ]
+            resultados = await asyncio.gather(*lecturas)
+            cantidad_abierta = resultados[0]
+            cerrar_antes, voltear = self.pasos.plan(senal, cantidad_abierta)
+            if cerrar_antes:
+                await _medir(tiempos, 'cierre', self.cerrar_posicion_con_limite(ticker, id_cierre))
+
+            if posicion_final == 0:
+                print(f"Cerrando posición en {ticker} debido a señal con posición estratégica = 0.")
+                await _medir(tiempos, 'cierre', self.cerrar_posicion_con_limite(ticker, id_cierre))
+            else:
+                _, balance, precio_limite = resultados
+                step_size = medir(tiempos, 'step_size', self.pasos.step_size, ticker)
+                tiempos['lecturas'] = round((time.perf_counter() - inicio) * 1000, 2)
+
+                tamano = self.pasos.tamano(balance, step_size)
+
+                if precio_limite is None:
+                    print("No se pudo calcular el precio límite. Operación cancelada.")
+                    return
+
+                if voltear:
+                    await _medir(tiempos, 'flip', self.voltear_posicion(ticker, cantidad_abierta, accion, tamano, precio_limite, id_cierre, id_entrada))
+                else:
+                    await _medir(tiempos, 'orden', self.enviar_orden_limite(ticker, accion, tamano, precio_limite, client_order_id=id_entrada))
+        except Exception as e:
+            logging.error(f"Error al ejecutar la señal: {e}")
+            traceback.print_exc()
+        finally:
+            tiempos['total'] = round((time.perf_counter() - inicio) * 1000, 2)
+            self.registro_tiempos.registrar(tiempos)
+            logging.debug(f"Tiempos de la señal {ticker} (ms): {tiempos}")
+
+    def estado(self):
+        return {
+            'en_vuelo': self.en_vuelo,
+            'capacidad': self.capacidad,
+            'carriles': len(self.carriles),
+            'procesadas': self.procesadas,
+            'rechazadas': self.rechazadas,
+            'coalescer': self.coalescer,
+            'reemplazadas': self.reemplazadas,
+        }
@@ -0,0 +1,163 @@
+import time
+import logging
+from collections import deque
+from threading import Thread, Condition, Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metricas import RegistroTiempos
+
+# === DESPACHO DE NOTIFICACIONES (Telegram, Slack, ...) ===
+# Cada destino tiene su propia cola acotada, su cubo de tokens, su requests.Session
+# (conexiones reutilizadas contra su host) y su hilo de entrega, así que un destino
+# lento o limitado no retrasa a los demás. Encolar nunca bloquea: con la cola llena
+# el mensaje nuevo se fusiona con el último pendiente si cabe en el límite de
+# tamaño del destino y, si no, se descarta el más antiguo.
+#
+# Con `ventana_resumen` > 0 los mensajes normales que llegan dentro de esa ventana
+# se agrupan en un único resumen por destino (respetando `max_caracteres`). Los
+# urgentes (nivel error) van por una cola aparte que se entrega antes y sin esperar.
+
+class CuboTokens:
+    def __init__(self, tasa, rafaga):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.tokens = rafaga
+        self.ultimo = time.monotonic()
+        self._bloqueo = Lock()
+
+    def esperar(self):
+        # Devuelve cuántos segundos hay que esperar antes de poder enviar
+        with self._bloqueo:
+            ahora = time.monotonic()
+            self.tokens = min(self.rafaga, self.tokens + (ahora - self.ultimo) * self.tasa)
+            self.ultimo = ahora
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.tasa
+
+class Destino:
+    def __init__(self, nombre, url, construir_payload, tasa=1.0, rafaga=5, capacidad=100,
+                 max_caracteres=4000, ventana_resumen=0, timeout=10):
+        self.nombre = nombre
+        self.url = url
+        self.construir_payload = construir_payload
+        self.cubo = CuboTokens(tasa, rafaga)
+        self.capacidad = capacidad
+        self.max_caracteres = max_caracteres
+        self.ventana_resumen = ventana_resumen
+        self.timeout = timeout
+        self.sesion = requests.Session()
+        self.sesion.mount(url.split('/', 3)[0] + '//', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.pendientes = deque()
+        self.urgentes = deque()
+        self.condicion = Condition()
+        self.tiempos = RegistroTiempos()
+        self.enviados = 0
+        self.fallidos = 0
+        self.descartados = 0
+        self.fusionados = 0
+        self.resumenes = 0
+        self.eventos_resumidos = 0
+        self.trabajador = Thread(target=self._entregar, name=f'notificaciones-{nombre}')
+        self.trabajador.daemon = True
+        self.trabajador.start()
+
+    def encolar(self, texto, urgente=False):
+        # Elementos de cola: (texto, instante de encolado, eventos que contiene)
+        cola = self.urgentes if urgente else self.pendientes
+        with self.condicion:
+            if len(cola) >= self.capacidad:
+                ultimo_texto, encolado, eventos = cola[-1]
+                # Un elemento con varios eventos sale con la cabecera de resumen: cuenta en el límite
+                cabecera = 0 if urgente else len(f"Resumen de {eventos + 1} eventos:\n")
+                if cabecera + len(ultimo_texto) + 1 + len(texto) <= self.max_caracteres:
+                    cola[-1] = (f"{ultimo_texto}\n{texto}", encolado, eventos + 1)
+                    self.fusionados += 1
+                    return
+                cola.popleft()
+                self.descartados += 1
+                logging.warning(f"Cola de notificaciones de {self.nombre} llena; se descarta el mensaje más antiguo.")
+            cola.append((texto[:self.max_caracteres], time.monotonic(), 1))
+            self.condicion.notify()
+
+    def _siguiente(self):
+        with self.condicion:
+            while True:
+                while not self.urgentes and not self.pendientes:
+                    self.condicion.wait()
+                if self.urgentes:
+                    return self.urgentes.popleft()[:2]
+                restante = self.pendientes[0][1] + self.ventana_resumen - time.monotonic()
+                if restante <= 0:
+                    return self._armar_resumen()
+                # Se espera al cierre de la ventana; un urgente interrumpe la espera
+                self.condicion.wait(restante)
+
+    def _armar_resumen(self):
+        textos = []
+        eventos = 0
+        longitud = 0
+        encolado = self.pendientes[0][1]
+        while self.pendientes:
+            texto, _, n = self.pendientes[0]
+            cabecera = len(f"Resumen de {eventos + n} eventos:\n")
+            if textos and cabecera + longitud + 1 + len(texto) > self.max_caracteres:
+                break
+            self.pendientes.popleft()
+            textos.append(texto)
+            eventos += n
+            longitud += len(texto) + (1 if len(textos) > 1 else 0)
+            if not self.ventana_resumen:
+                break
+        if eventos == 1:
+            return textos[0], encolado
+        self.resumenes += 1
+        self.eventos_resumidos += eventos
+        return f"Resumen de {eventos} eventos:\n" + "\n".join(textos), encolado
+
+    def _entregar(self):
+        while True:
+            texto, encolado = self._siguiente()
+            espera = self.cubo.esperar()
+            if espera:
+                time.sleep(espera)
+            try:
+                respuesta = self.sesion.post(self.url, json=self.construir_payload(texto), timeout=self.timeout)
+                respuesta.raise_for_status()
+                self.enviados += 1
+            except Exception as e:
+                self.fallidos += 1
+                logging.error(f"Error al enviar notificación a {self.nombre}: {e}")
+            self.tiempos.registrar({'entrega': round((time.monotonic() - encolado) * 1000, 2)})
+
+    def estado(self):
+        return {
+            'pendientes': len(self.pendientes),
+            'urgentes': len(self.urgentes),
+            'capacidad': self.capacidad,
+            'enviados': self.enviados,
+            'fallidos': self.fallidos,
+            'descartados': self.descartados,
+            'fusionados': self.fusionados,
+            'resumenes': self.resumenes,
+            'eventos_resumidos': self.eventos_resumidos,
+            'latencia_ms': self.tiempos.resumen().get('entrega'),
+        }
+
+class DespachadorNotificaciones:
+    def __init__(self):
+        self.destinos = {}
+
+    def registrar(self, destino):
+        self.destinos[destino.nombre] = destino
+
+    def enviar(self, nombre, texto, urgente=False):
+        destino = self.destinos.get(nombre)
+        if destino is None:
+            return False
+        destino.encolar(texto, urgente)
+        return True
+
+    def estado(self):
+        return {nombre: destino.estado() for nombre, destino in self.destinos.items()}
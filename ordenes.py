@@ -0,0 +1,191 @@
+import time
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+from mercados import normalizar_simbolo
+
+# === REGISTRO LOCAL DE ÓRDENES ===
+# Cada orden sale con un newClientOrderId derivado de la señal que la origina y de
+# su pata (entrada o cierre), así que reenviar la misma orden (p. ej. el fallback
+# de batchOrders) reutiliza el id y el exchange rechaza el duplicado en vez de
+# abrir dos veces. La misma alerta repetida después del TTL de deduplicación es
+# otra señal, con otro nonce, y sus órdenes llevan ids nuevos. Con ese id se mantiene en memoria una máquina de estados por
+# orden (NEW → PARTIALLY_FILLED → FILLED / CANCELLED) que avanza con los eventos
+# ORDER_TRADE_UPDATE del stream de usuario; el estado de una orden se resuelve aquí
+# sin consultar al exchange. Cada cambio se entrega a `persistir(instantanea)`, que
+# solo encola: la escritura en Trade la hace el escritor diferido por lotes.
+
+NUEVA = 'NEW'
+PARCIAL = 'PARTIALLY_FILLED'
+LLENA = 'FILLED'
+CANCELADA = 'CANCELLED'
+FALLIDA = 'FAILED'
+
+# Estado de Binance (campo X) → estado local
+ESTADOS_BINANCE = {
+    'NEW': NUEVA,
+    'PARTIALLY_FILLED': PARCIAL,
+    'FILLED': LLENA,
+    'CANCELED': CANCELADA,
+    'EXPIRED': CANCELADA,
+    'EXPIRED_IN_MATCH': CANCELADA,
+    'REJECTED': FALLIDA,
+}
+FINALES = (LLENA, CANCELADA)
+RANGO = {FALLIDA: -1, NUEVA: 0, PARCIAL: 1, LLENA: 2, CANCELADA: 2}
+PATAS = {'límite': 'e', 'cierre_límite': 'c'}
+
+def id_cliente(senal, pata):
+    # Determinista dentro de una señal (clave de la alerta + nonce de la señal):
+    # reenviar una pata da el mismo id, repetir la alerta no.
+    base = hashlib.sha256(
+        f"{senal.clave or f'{senal.accion}|{senal.ticker}|{senal.posicion_final}'}|{senal.nonce}".encode('utf-8')
+    ).hexdigest()
+    return f"tv-{base[:24]}-{PATAS.get(pata, pata)}"
+
+class RegistroOrdenes:
+    def __init__(self, persistir=None, maximo=5000):
+        self.persistir = persistir
+        self.maximo = maximo
+        self.ordenes = OrderedDict()
+        self.senales = OrderedDict()
+        self.eventos = 0
+        self.ignorados = 0
+        self._bloqueo = Lock()
+
+    def nuevo_id(self, senal, pata):
+        # Reserva el id de una pata y recuerda la señal para guardarla con la orden
+        client_id = id_cliente(senal, pata)
+        with self._bloqueo:
+            self.senales[client_id] = {'accion': senal.accion, 'ticker': senal.ticker, 'posicion_final': senal.posicion_final}
+            while len(self.senales) > self.maximo:
+                self.senales.popitem(last=False)
+        return client_id
+
+    def registrar(self, client_id, simbolo, direccion, cantidad, precio, tipo, reduce_only=False):
+        ahora = int(time.time() * 1000)
+        with self._bloqueo:
+            if client_id in self.ordenes:
+                return self.ordenes[client_id]
+            orden = {
+                'client_order_id': client_id,
+                'order_id': None,
+                'simbolo': normalizar_simbolo(simbolo),
+                'lado': direccion.upper(),
+                'tipo': tipo,
+                'reduce_only': reduce_only,
+                'cantidad': cantidad,
+                'precio': precio,
+                'estado': NUEVA,
+                'ejecutado': 0.0,
+                'precio_medio': None,
+                'comision': 0.0,
+                'comision_activo': None,
+                'error': None,
+                'senal': self.senales.pop(client_id, None),
+                'creada': ahora,
+                'actualizado': ahora,
+            }
+            self.ordenes[client_id] = orden
+            self._marcar(client_id)
+            self._recortar()
+            return orden
+
+    def confirmar(self, client_id, respuesta):
+        # Respuesta REST (create_order o una entrada de batchOrders)
+        info = respuesta.get('info', respuesta) if isinstance(respuesta, dict) else {}
+        with self._bloqueo:
+            orden = self.ordenes.get(client_id)
+            if orden is None:
+                return
+            orden['order_id'] = str(info.get('orderId') or respuesta.get('id') or '') or None
+            estado = ESTADOS_BINANCE.get(info.get('status'))
+            if estado:
+                self._transicion(orden, estado, float(info.get('executedQty') or 0), info.get('avgPrice'))
+            self._marcar(client_id)
+
+    def fallar(self, client_id, error):
+        with self._bloqueo:
+            orden = self.ordenes.get(client_id)
+            if orden is None or orden['estado'] != NUEVA or orden['order_id']:
+                return
+            orden['estado'] = FALLIDA
+            orden['error'] = str(error)
+            orden['actualizado'] = int(time.time() * 1000)
+            self._marcar(client_id)
+
+    def al_orden(self, evento):
+        # ORDER_TRADE_UPDATE: {"o": {"c", "i", "X", "z", "ap", "n", "N", "T", ...}}
+        o = evento.get('o', {})
+        with self._bloqueo:
+            self.eventos += 1
+            orden = self.ordenes.get(o.get('c'))
+            if orden is None:
+                # Orden que no salió de este proceso (manual, otro worker)
+                self.ignorados += 1
+                return
+            if o.get('i') is not None:
+                orden['order_id'] = str(o['i'])
+            if o.get('x') == 'TRADE' and o.get('n'):
+                orden['comision'] += float(o['n'])
+                orden['comision_activo'] = o.get('N')
+            estado = ESTADOS_BINANCE.get(o.get('X'))
+            if estado and self._transicion(orden, estado, float(o.get('z') or 0), o.get('ap'), o.get('T')):
+                self._marcar(orden['client_order_id'])
+
+    def _transicion(self, orden, estado, ejecutado, precio_medio, instante=None):
+        # Solo hacia delante: FILLED y CANCELLED son finales y un parcial con menos
+        # cantidad ejecutada que la conocida es un evento atrasado. FAILED es un envío
+        # fallido visto desde aquí; si el exchange informa después de esa orden (un
+        # reenvío rechazado por id duplicado de una orden que sí entró), manda el exchange.
+        actual = orden['estado']
+        if actual in FINALES or ejecutado < orden['ejecutado']:
+            return False
+        if estado == FALLIDA:
+            if actual != NUEVA:
+                return False
+        elif RANGO[estado] < RANGO[actual]:
+            return False
+        orden['estado'] = estado
+        orden['ejecutado'] = ejecutado
+        if precio_medio and float(precio_medio):
+            orden['precio_medio'] = float(precio_medio)
+        orden['actualizado'] = instante or int(time.time() * 1000)
+        return True
+
+    def _marcar(self, client_id):
+        if self.persistir:
+            self.persistir(dict(self.ordenes[client_id]))
+
+    def _recortar(self):
+        # Se olvidan primero las órdenes más antiguas ya terminadas
+        sobrantes = len(self.ordenes) - self.maximo
+        for client_id in list(self.ordenes):
+            if sobrantes <= 0:
+                break
+            if self.ordenes[client_id]['estado'] in (LLENA, CANCELADA, FALLIDA):
+                del self.ordenes[client_id]
+                sobrantes -= 1
+
+    def obtener(self, client_id):
+        with self._bloqueo:
+            orden = self.ordenes.get(client_id)
+            return dict(orden) if orden else None
+
+    def abiertas(self, simbolo=None):
+        with self._bloqueo:
+            return [dict(o) for o in self.ordenes.values()
+                    if o['estado'] in (NUEVA, PARCIAL) and (simbolo is None or o['simbolo'] == normalizar_simbolo(simbolo))]
+
+    def estado(self):
+        with self._bloqueo:
+            por_estado = {}
+            for orden in self.ordenes.values():
+                por_estado[orden['estado']] = por_estado.get(orden['estado'], 0) + 1
+            return {
+                'ordenes': len(self.ordenes),
+                'por_estado': por_estado,
+                'eventos': self.eventos,
+                'ignorados': self.ignorados,
+            }
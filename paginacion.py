@@ -0,0 +1,131 @@
+import json
+import base64
+from datetime import datetime
+
+from sqlalchemy import String, select, tuple_, type_coerce
+
+# === PAGINACIÓN POR CURSOR DE TRADES ===
+# /api/trades no usa OFFSET: cada página continúa desde el último (created_at, id)
+# visto, que llega opaco en `cursor`, y la consulta baja por el índice
+# (created_at, id) sin recorrer las filas anteriores, así que la página 1 y la
+# página 10.000 cuestan lo mismo con millones de trades. El modo `since_id` devuelve,
+# en orden de id, solo los trades insertados después del último conocido.
+#
+# Las filas salen como listas en el orden de COLUMNAS, serializadas tal cual las
+# devuelve el cursor de la base de datos: sin objetos ORM ni un dict por fila. Los
+# enums se leen como texto (se guardan por nombre, que coincide con su valor).
+
+COLUMNAS = ('id', 'client_order_id', 'symbol', 'side', 'quantity', 'price', 'filled_quantity',
+            'avg_price', 'status', 'created_at', 'error_message')
+LIMITE_POR_DEFECTO = 20
+LIMITE_MAXIMO = 500
+
+def codificar_cursor(creado, id_trade):
+    return base64.urlsafe_b64encode(f"{creado.isoformat()}|{id_trade}".encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(cursor):
+    try:
+        creado, id_trade = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(creado), int(id_trade)
+    except Exception:
+        raise ValueError("cursor no válido")
+
+def _json(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"{type(valor).__name__} no serializable")
+
+def consultar_trades(limite=LIMITE_POR_DEFECTO, cursor=None, since_id=None, symbol=None, status=None, desde=None, hasta=None):
+    # Devuelve el cuerpo JSON ya serializado:
+    # {"columns": [...], "rows": [[...], ...], "next_cursor": ... | "last_id": ...}
+    from app import db
+    from models import Trade, OrderStatus
+    from mercados import normalizar_simbolo
+
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    columnas = [getattr(Trade, c) for c in COLUMNAS]
+    columnas[COLUMNAS.index('side')] = type_coerce(Trade.side, String).label('side')
+    columnas[COLUMNAS.index('status')] = type_coerce(Trade.status, String).label('status')
+    consulta = select(*columnas)
+
+    if symbol:
+        consulta = consulta.where(Trade.symbol == normalizar_simbolo(symbol))
+    if status:
+        if status.upper() not in OrderStatus.__members__:
+            raise ValueError(f"estado no válido: {status}")
+        consulta = consulta.where(Trade.status == OrderStatus[status.upper()])
+    if desde:
+        consulta = consulta.where(Trade.created_at >= desde)
+    if hasta:
+        consulta = consulta.where(Trade.created_at < hasta)
+
+    if since_id is not None:
+        consulta = consulta.where(Trade.id > since_id).order_by(Trade.id.asc())
+    else:
+        if cursor:
+            creado, id_trade = decodificar_cursor(cursor)
+            consulta = consulta.where(tuple_(Trade.created_at, Trade.id) < tuple_(creado, id_trade))
+        consulta = consulta.order_by(Trade.created_at.desc(), Trade.id.desc())
+
+    # Una fila de más dice si hay otra página sin contar el total
+    filas = [tuple(f) for f in db.session.execute(consulta.limit(limite + 1))]
+    hay_mas = len(filas) > limite
+    del filas[limite:]
+
+    cuerpo = {'columns': COLUMNAS, 'rows': filas}
+    if since_id is not None:
+        cuerpo['last_id'] = filas[-1][0] if filas else since_id
+        cuerpo['has_more'] = hay_mas
+    else:
+        ultima = filas[-1] if hay_mas else None
+        cuerpo['next_cursor'] = codificar_cursor(ultima[COLUMNAS.index('created_at')], ultima[0]) if ultima else None
+    return json.dumps(cuerpo, default=_json, separators=(',', ':'))
+
+# === BENCHMARK: python paginacion.py ===
+# Con FILAS_TRADES trades (1M por defecto) en un SQLite temporal, compara una página
+# profunda por cursor con la misma página pedida con OFFSET. Necesita el mismo
+# entorno que la app (importa app y models).
+if __name__ == "__main__":
+    import os
+    import time
+    import random
+    import tempfile
+    from datetime import timedelta
+
+    FILAS = int(os.environ.get('FILAS_TRADES', 1000000))
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'paginas.db')}"
+
+    from app import app, db
+    from models import Trade
+    from sqlalchemy import text
+
+    inicio = datetime.utcnow() - timedelta(days=365)
+    with app.app_context():
+        conexion = db.engine.raw_connection()
+        conexion.executemany(
+            "INSERT INTO trade (symbol, side, order_type, quantity, status, client_order_id, created_at) "
+            "VALUES (?, 'BUY', 'LIMIT', 1.0, ?, ?, ?)",
+            ((f"SYM{random.randrange(50)}USDT", random.choice(['FILLED', 'CANCELLED', 'PENDING']),
+              f"tv-{i}", inicio + timedelta(seconds=i * 30)) for i in range(FILAS))
+        )
+        conexion.commit()
+        conexion.close()
+        db.session.execute(text("ANALYZE"))
+
+        def medir(funcion, repeticiones=20):
+            t = time.perf_counter()
+            for _ in range(repeticiones):
+                funcion()
+            return (time.perf_counter() - t) / repeticiones * 1000
+
+        # Cursor de la página que empieza tras ~80% de la tabla
+        profundidad = int(FILAS * 0.8)
+        creado, id_trade = db.session.query(Trade.created_at, Trade.id).order_by(
+            Trade.created_at.desc(), Trade.id.desc()).offset(profundidad - 1).first()
+        cursor = codificar_cursor(creado, id_trade)
+
+        print(f"primera página     {medir(lambda: consultar_trades(50)):8.2f} ms")
+        print(f"cursor profundo    {medir(lambda: consultar_trades(50, cursor=cursor)):8.2f} ms")
+        print(f"OFFSET {profundidad:<11} {medir(lambda: Trade.query.order_by(Trade.created_at.desc(), Trade.id.desc()).offset(profundidad).limit(50).all(), 3):8.2f} ms")
+        print(f"símbolo + estado   {medir(lambda: consultar_trades(50, symbol='SYM1USDT', status='FILLED')):8.2f} ms")
+        print(f"since_id           {medir(lambda: consultar_trades(50, since_id=FILAS - 100)):8.2f} ms")
@@ -0,0 +1,406 @@
+import json
+import time
+import dataclasses
+import atexit
+import logging
+from collections import deque
+from datetime import datetime
+from threading import Thread, Condition
+
+from mercados import normalizar_simbolo
+from metricas import RegistroTiempos
+
+# === PERSISTENCIA DIFERIDA (WRITE-BEHIND) ===
+# El pipeline de ejecución no escribe en la base de datos: encola eventos (órdenes,
+# posiciones, cierres, señales reemplazadas) y un hilo escritor los vuelca en bloque con las
+# operaciones bulk de SQLAlchemy, con un commit cada `max_filas` eventos o cada
+# `max_espera_ms` milisegundos, lo que llegue antes. Así la latencia de una señal no
+# depende de la velocidad de la base de datos.
+#
+# Un lote que falla no se descarta. Si la base de datos no responde, vuelve entero
+# al frente de la cola y se reintenta. Si responde, el fallo es de algún registro:
+# se reescribe cada tipo en su propia transacción y, dentro del tipo que falla, cada
+# registro por separado, así que el resto del lote se guarda. El registro que sigue
+# fallando vuelve a la cola y, tras `max_intentos`, se aparta al archivo de
+# descartes (JSON Lines) para no bloquear a los demás. Lo mismo pasa con lo que
+# llega con la cola ya en `max_pendientes`. Al salir se vacía la cola antes de terminar.
+#
+# Los imports de la app y los modelos son diferidos: este módulo se carga desde el
+# motor de ejecución, antes de que exista la aplicación Flask.
+
+MOTIVO_REEMPLAZADA = "SUPERSEDED"
+
+ESTADOS_TRADE = {
+    'NEW': 'PENDING',
+    'PARTIALLY_FILLED': 'PARTIALLY_FILLED',
+    'FILLED': 'FILLED',
+    'CANCELLED': 'CANCELLED',
+    'FAILED': 'FAILED',
+}
+
+def escribir_senales_reemplazadas(registros):
+    # registros: [(reemplazadas, nueva), ...]
+    from app import db
+    from models import Trade, OrderSide, OrderType, OrderStatus
+
+    filas = []
+    for reemplazadas, nueva in registros:
+        for senal in reemplazadas:
+            filas.append({
+                'symbol': normalizar_simbolo(senal.ticker),
+                'side': OrderSide.BUY if senal.accion == 'buy' else OrderSide.SELL,
+                'order_type': OrderType.LIMIT,
+                'quantity': 0.0,
+                'status': OrderStatus.CANCELLED,
+                'signal_data': json.dumps({
+                    'accion': senal.accion,
+                    'ticker': senal.ticker,
+                    'posicion_final': senal.posicion_final,
+                }),
+                'error_message': f"{MOTIVO_REEMPLAZADA}: reemplazada por {nueva.accion} con posición estratégica {nueva.posicion_final}",
+            })
+    db.session.bulk_insert_mappings(Trade, filas)
+
+def escribir_ordenes(instantaneas):
+    # Upsert por client_order_id: si una orden cambió varias veces dentro del lote,
+    # solo cuenta su última instantánea.
+    from app import db
+    from models import Trade, OrderSide, OrderType, OrderStatus
+
+    ultimas = {o['client_order_id']: o for o in instantaneas}
+    existentes = dict(db.session.query(Trade.client_order_id, Trade.id)
+                      .filter(Trade.client_order_id.in_(list(ultimas))))
+    ahora = datetime.utcnow()
+    nuevas, cambios = [], []
+    for client_id, orden in ultimas.items():
+        fila = {
+            'order_id': orden['order_id'],
+            'status': OrderStatus[ESTADOS_TRADE[orden['estado']]],
+            'filled_quantity': orden['ejecutado'],
+            'avg_price': orden['precio_medio'],
+            'commission': orden['comision'],
+            'commission_asset': orden['comision_activo'],
+            'error_message': orden['error'],
+            'updated_at': ahora,
+        }
+        if client_id in existentes:
+            fila['id'] = existentes[client_id]
+            cambios.append(fila)
+            continue
+        fila.update({
+            'symbol': orden['simbolo'],
+            'side': OrderSide[orden['lado']],
+            'order_type': OrderType.LIMIT,
+            'quantity': orden['cantidad'],
+            'price': orden['precio'],
+            'client_order_id': client_id,
+            'signal_data': json.dumps(orden['senal']) if orden['senal'] else None,
+            'created_at': datetime.utcfromtimestamp(orden['creada'] / 1000),
+        })
+        nuevas.append(fila)
+    db.session.bulk_insert_mappings(Trade, nuevas)
+    db.session.bulk_update_mappings(Trade, cambios)
+
+def escribir_posiciones(cambios):
+    # cambios: [{'simbolo', 'cantidad', 'precio_entrada', 'pnl_no_realizado', 'actualizado'}, ...]
+    # Una fila OPEN por símbolo: se actualiza mientras conserve el lado, se cierra
+    # cuando la cantidad llega a cero y se abre otra si la posición cambia de lado.
+    #
+    # Cada worker con el stream de usuario recibe los mismos cambios: si dos abren a
+    # la vez la fila de un símbolo, el índice único parcial ux_position_open_symbol
+    # rechaza el segundo commit y al reintentarlo la fila OPEN ya existe y se actualiza.
+    from app import db
+    from models import Position, OrderSide, PositionStatus
+
+    simbolos = {c['simbolo'] for c in cambios}
+    abiertas = {p.symbol: p for p in Position.query.filter(
+        Position.status == PositionStatus.OPEN, Position.symbol.in_(simbolos))}
+    for cambio in cambios:
+        simbolo = cambio['simbolo']
+        instante = datetime.utcfromtimestamp(cambio['actualizado'] / 1000)
+        lado = OrderSide.BUY if cambio['cantidad'] > 0 else OrderSide.SELL
+        abierta = abiertas.get(simbolo)
+        if abierta and (not cambio['cantidad'] or abierta.side != lado):
+            abierta.status = PositionStatus.CLOSED
+            abierta.closed_at = instante
+            abierta = abiertas[simbolo] = None
+        if not cambio['cantidad']:
+            continue
+        if abierta is None:
+            abierta = abiertas[simbolo] = Position(symbol=simbolo, side=lado, created_at=instante)
+            db.session.add(abierta)
+        abierta.quantity = abs(cambio['cantidad'])
+        abierta.entry_price = cambio['precio_entrada']
+        abierta.unrealized_pnl = cambio['pnl_no_realizado']
+
+def escribir_cierres(cierres):
+    # El PnL realizado va a la fila de Position del ciclo cerrado: la del mismo lado que
+    # aún no lo tiene y que estaba abierta en el instante del cierre (sigue abierta o se
+    # cerró entonces; ledger y ciclos usan el mismo tiempo de transacción). Si no
+    # existe, se crea ya cerrada. Después, rollup incremental en TradingAnalytics:
+    # fila del símbolo y fila global del día.
+    #
+    # Cada worker con el stream de usuario recibe el mismo cierre: la clave del fill
+    # (Position.close_key, única) hace que solo el primero lo aplique. Si dos lo
+    # escriben a la vez, el índice único rechaza el segundo commit y al reintentarlo
+    # el cierre ya consta y se salta.
+    from app import db
+    from models import Position, TradingAnalytics, OrderSide, PositionStatus
+    from analitica import SIMBOLO_GLOBAL, acumular_cierre
+
+    claves = [c['clave'] for c in cierres if c.get('clave')]
+    aplicadas = {clave for (clave,) in db.session.query(Position.close_key).filter(Position.close_key.in_(claves))}
+    filas = {}
+    for cierre in cierres:
+        clave = cierre.get('clave')
+        if clave in aplicadas:
+            continue
+        if clave:
+            aplicadas.add(clave)
+        cerrada = datetime.utcfromtimestamp(cierre['cerrada'] / 1000)
+        posicion = (Position.query
+                    .filter_by(symbol=cierre['simbolo'], side=OrderSide[cierre['lado']], close_price=None)
+                    .filter(Position.created_at <= cerrada,
+                            db.or_(Position.closed_at.is_(None), Position.closed_at >= cerrada))
+                    .order_by(Position.id.desc())
+                    .first())
+        if posicion is None:
+            posicion = Position(
+                symbol=cierre['simbolo'],
+                side=OrderSide[cierre['lado']],
+                quantity=cierre['cantidad'],
+                entry_price=cierre['precio_entrada'],
+                status=PositionStatus.CLOSED,
+                closed_at=cerrada,
+                created_at=datetime.utcfromtimestamp(cierre['abierta'] / 1000),
+            )
+            db.session.add(posicion)
+        posicion.close_key = clave
+        posicion.close_price = cierre['precio_salida']
+        posicion.realized_pnl = cierre['pnl']
+        posicion.pnl = cierre['pnl']
+
+        dia = cerrada.date()
+        for simbolo in (cierre['simbolo'], SIMBOLO_GLOBAL):
+            fila = filas.get((simbolo, dia))
+            if fila is None:
+                fila = TradingAnalytics.query.filter_by(symbol=simbolo, date=dia).first()
+                if fila is None:
+                    fila = TradingAnalytics(symbol=simbolo, date=dia)
+                    db.session.add(fila)
+                filas[(simbolo, dia)] = fila
+            acumular_cierre(fila, cierre)
+
+ESCRITORES = {
+    'orden': escribir_ordenes,
+    'posicion': escribir_posiciones,
+    'cierre': escribir_cierres,
+    'reemplazada': escribir_senales_reemplazadas,
+}
+
+# Tipos en los que un registro posterior con la misma clave sustituye al anterior:
+# si el anterior falla y el posterior se guarda, el anterior ya no se reintenta.
+CLAVES = {
+    'orden': lambda registro: registro['client_order_id'],
+    'posicion': lambda registro: registro['simbolo'],
+}
+
+def _serializable(valor):
+    if dataclasses.is_dataclass(valor):
+        return dataclasses.asdict(valor)
+    return str(valor)
+
+class EscritorDiferido:
+    def __init__(self, escritores=ESCRITORES, max_filas=200, max_espera_ms=250, reintento=1.0, reintentos_al_salir=3,
+                 max_intentos=5, max_pendientes=100000, archivo_descartes='eventos_no_guardados.jsonl'):
+        self.escritores = escritores
+        self.max_filas = max_filas
+        self.max_espera_ms = max_espera_ms
+        self.reintento = reintento
+        self.reintentos_al_salir = reintentos_al_salir
+        self.max_intentos = max_intentos
+        self.max_pendientes = max_pendientes
+        self.archivo_descartes = archivo_descartes
+        # (tipo, registro, encolado, intentos)
+        self.pendientes = deque()
+        self.condicion = Condition()
+        self.tiempos = RegistroTiempos()
+        self.encolados = 0
+        self.escritos = 0
+        self.lotes = 0
+        self.errores = 0
+        self.descartados = 0
+        self._detener = False
+        self.trabajador = Thread(target=self._trabajar, name='escritor-diferido')
+        self.trabajador.daemon = True
+
+    def iniciar(self):
+        self.trabajador.start()
+        atexit.register(self.detener)
+
+    def detener(self, timeout=10):
+        # Se vacía lo pendiente antes de terminar
+        with self.condicion:
+            self._detener = True
+            self.condicion.notify()
+        self.trabajador.join(timeout)
+
+    def encolar(self, tipo, registro):
+        with self.condicion:
+            if len(self.pendientes) >= self.max_pendientes:
+                lleno = True
+            else:
+                lleno = False
+                self.pendientes.append((tipo, registro, time.monotonic(), 0))
+                self.encolados += 1
+            # El primero arranca el reloj de max_espera_ms; con max_filas se vuelca ya
+            if len(self.pendientes) == 1 or len(self.pendientes) >= self.max_filas:
+                self.condicion.notify()
+        if lleno:
+            self._descartar([(tipo, registro, time.monotonic(), 0)], "cola de persistencia llena")
+
+    def _descartar(self, pendientes, motivo):
+        # Fuera de la cola pero no perdido: queda en el archivo para reprocesarlo a mano
+        self.descartados += len(pendientes)
+        logging.error(f"Se apartan {len(pendientes)} eventos a {self.archivo_descartes}: {motivo}")
+        try:
+            with open(self.archivo_descartes, 'a') as archivo:
+                for tipo, registro, _, intentos in pendientes:
+                    archivo.write(json.dumps({
+                        'instante': datetime.utcnow().isoformat(),
+                        'tipo': tipo,
+                        'intentos': intentos,
+                        'motivo': motivo,
+                        'registro': registro,
+                    }, default=_serializable) + "\n")
+        except Exception as e:
+            logging.error(f"No se pudieron escribir los eventos descartados: {e}")
+
+    def _siguiente_lote(self):
+        with self.condicion:
+            while True:
+                if self.pendientes:
+                    restante = self.pendientes[0][2] + self.max_espera_ms / 1000 - time.monotonic()
+                    if self._detener or restante <= 0 or len(self.pendientes) >= self.max_filas:
+                        return [self.pendientes.popleft() for _ in range(min(self.max_filas, len(self.pendientes)))]
+                    self.condicion.wait(restante)
+                elif self._detener:
+                    return None
+                else:
+                    self.condicion.wait()
+
+    def _escribir(self, por_tipo):
+        from app import app, db
+
+        with app.app_context():
+            try:
+                for tipo, registros in por_tipo.items():
+                    self.escritores[tipo](registros)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _base_disponible(self):
+        from app import app, db
+        from sqlalchemy import text
+
+        try:
+            with app.app_context():
+                db.session.execute(text("SELECT 1"))
+                db.session.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _aislar(self, lote):
+        # Reescribe el lote que falló por tipo y, en el tipo que falla, registro a
+        # registro. Devuelve (escritos, fallidos); los fallidos ya llevan el intento sumado.
+        por_tipo = {}
+        for pendiente in lote:
+            por_tipo.setdefault(pendiente[0], []).append(pendiente)
+        escritos, fallidos = 0, []
+        for tipo, pendientes in por_tipo.items():
+            try:
+                self._escribir({tipo: [p[1] for p in pendientes]})
+                escritos += len(pendientes)
+                continue
+            except Exception:
+                pass
+            clave = CLAVES.get(tipo)
+            guardadas = {}
+            errores = []
+            for posicion, pendiente in enumerate(pendientes):
+                try:
+                    self._escribir({tipo: [pendiente[1]]})
+                    escritos += 1
+                    if clave:
+                        guardadas[clave(pendiente[1])] = posicion
+                except Exception as e:
+                    errores.append((posicion, pendiente, e))
+            for posicion, (tipo_, registro, encolado, intentos), e in errores:
+                if clave and guardadas.get(clave(registro), -1) > posicion:
+                    continue  # Sustituido por un registro posterior que sí se guardó
+                logging.error(f"No se pudo guardar un evento '{tipo_}' (intento {intentos + 1}): {e}")
+                fallidos.append((tipo_, registro, encolado, intentos + 1))
+        return escritos, fallidos
+
+    def _trabajar(self):
+        fallos_seguidos = 0
+        while True:
+            lote = self._siguiente_lote()
+            if lote is None:
+                return
+            # Agrupado por tipo; dentro de cada tipo se conserva el orden de llegada
+            por_tipo = {}
+            for tipo, registro, _, _ in lote:
+                por_tipo.setdefault(tipo, []).append(registro)
+            inicio = time.perf_counter()
+            try:
+                self._escribir(por_tipo)
+                escritos, fallidos = len(lote), []
+            except Exception as e:
+                self.errores += 1
+                if not self._base_disponible():
+                    fallos_seguidos += 1
+                    logging.error(f"Error al guardar un lote de {len(lote)} eventos; se reintentará: {e}")
+                    with self.condicion:
+                        self.pendientes.extendleft(reversed(lote))
+                        if self._detener and fallos_seguidos > self.reintentos_al_salir:
+                            logging.error(f"Se abandonan {len(self.pendientes)} eventos sin guardar al salir.")
+                            return
+                    time.sleep(self.reintento)
+                    continue
+                logging.error(f"Error al guardar un lote de {len(lote)} eventos; se aísla el registro que falla: {e}")
+                escritos, fallidos = self._aislar(lote)
+            fallos_seguidos = 0
+            if fallidos:
+                agotados, reintentar = [], []
+                for pendiente in fallidos:
+                    (agotados if pendiente[3] >= self.max_intentos or self._detener else reintentar).append(pendiente)
+                if agotados:
+                    self._descartar(agotados, "falló al salir" if self._detener else f"falló {self.max_intentos} veces")
+                if reintentar:
+                    with self.condicion:
+                        self.pendientes.extendleft(reversed(reintentar))
+                    time.sleep(self.reintento)
+            self.lotes += 1
+            self.escritos += escritos
+            self.tiempos.registrar({
+                'commit': round((time.perf_counter() - inicio) * 1000, 2),
+                'espera': round((time.monotonic() - lote[0][2]) * 1000, 2),
+            })
+
+    def estado(self):
+        return {
+            'pendientes': len(self.pendientes),
+            'max_filas': self.max_filas,
+            'max_espera_ms': self.max_espera_ms,
+            'encolados': self.encolados,
+            'escritos': self.escritos,
+            'lotes': self.lotes,
+            'errores': self.errores,
+            'descartados': self.descartados,
+            'archivo_descartes': self.archivo_descartes,
+            'tiempos_ms': self.tiempos.resumen(),
+        }
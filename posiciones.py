@@ -0,0 +1,235 @@
+import time
+import logging
+from threading import Thread, Lock, Event
+
+from mercados import normalizar_simbolo
+
+# === LIBRO DE POSICIONES EN MEMORIA ===
+# Se siembra una vez con positionRisk y después se mantiene al día con los eventos
+# del stream de usuario: ACCOUNT_UPDATE trae la cantidad absoluta de cada posición
+# y ORDER_TRADE_UPDATE aplica el fill en cuanto se produce. Cada `intervalo`
+# segundos se reconcilia contra positionRisk por si se perdió algún evento.
+# Solo se contempla el modo de posición único (positionSide BOTH).
+#
+# Aparte, cada fill abre, amplía o cierra el ciclo de vida de la posición de su
+# símbolo. Cuando un fill la lleva a cero (o le da la vuelta) se notifica el cierre
+# con el PnL realizado que calcula Binance (rp), el volumen y la duración. Los
+# ciclos solo dependen de los fills, así que no importa si ACCOUNT_UPDATE llega antes.
+
+class LibroPosiciones:
+    def __init__(self, descargar_posiciones, intervalo_reconciliacion=300):
+        self.descargar_posiciones = descargar_posiciones
+        self.intervalo_reconciliacion = intervalo_reconciliacion
+        self.posiciones = {}
+        self.sincronizado = False
+        self.sembrado_en = None
+        self.oyentes = []
+        self.oyentes_cierre = []
+        self.ciclos = {}
+        # T del último fill aplicado a los ciclos de cada símbolo
+        self.ultimo_fill = {}
+        self.cierres = 0
+        self.reconciliaciones = 0
+        self.discrepancias = 0
+        self._bloqueo = Lock()
+        self._detener = Event()
+        self.trabajador = Thread(target=self._reconciliar_periodicamente)
+        self.trabajador.daemon = True
+
+    def suscribir(self, callback):
+        # callback(simbolo, anterior, actual): se llama en cada cambio de posición
+        self.oyentes.append(callback)
+
+    def suscribir_cierres(self, callback):
+        # callback(cierre): {'simbolo', 'lado', 'cantidad', 'precio_entrada', 'precio_salida',
+        # 'pnl', 'volumen', 'abierta', 'cerrada', 'clave'} con instantes en ms. 'clave'
+        # identifica el fill que cerró (símbolo + trade id): es la misma en cada proceso
+        # que reciba el evento.
+        self.oyentes_cierre.append(callback)
+
+    def iniciar(self):
+        try:
+            self.sembrar()
+        except Exception as e:
+            logging.error(f"Error al sembrar el libro de posiciones: {e}")
+        self.trabajador.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def sembrar(self):
+        # Cada entrada lleva el updateTime de positionRisk, el mismo reloj que el T de
+        # los eventos del stream: con la hora local, un reloj adelantado haría
+        # descartar fills reales como "anteriores" a la siembra. Sin updateTime (símbolo
+        # nunca operado) vale 0 y cualquier evento la sustituye.
+        posiciones = self.descargar_posiciones()
+        for p in posiciones:
+            if p.get('positionSide', 'BOTH') != 'BOTH':
+                continue
+            actual = {
+                'cantidad': float(p['positionAmt']),
+                'precio_entrada': float(p.get('entryPrice') or 0),
+                'pnl_no_realizado': float(p.get('unRealizedProfit') or 0),
+                'actualizado': int(p.get('updateTime') or 0),
+            }
+            anterior = self.posiciones.get(p['symbol'])
+            # Una instantánea más vieja que el libro no es una discrepancia: la descarta _actualizar
+            if (self.sincronizado and anterior and anterior['cantidad'] != actual['cantidad']
+                    and actual['actualizado'] >= anterior['actualizado']):
+                self.discrepancias += 1
+                logging.warning(f"Reconciliación de {p['symbol']}: libro {anterior['cantidad']}, exchange {actual['cantidad']}.")
+            self._sembrar_ciclo(p['symbol'], actual)
+            self._actualizar(p['symbol'], actual)
+        self.sincronizado = True
+        self.sembrado_en = time.time()
+
+    def _reconciliar_periodicamente(self):
+        while not self._detener.wait(self.intervalo_reconciliacion):
+            try:
+                self.sembrar()
+                self.reconciliaciones += 1
+            except Exception as e:
+                logging.error(f"Error al reconciliar el libro de posiciones: {e}")
+
+    def _actualizar(self, simbolo, actual):
+        with self._bloqueo:
+            anterior = self.posiciones.get(simbolo)
+            if anterior and anterior['actualizado'] > actual['actualizado']:
+                return
+            self.posiciones[simbolo] = actual
+        if anterior is None or anterior['cantidad'] != actual['cantidad']:
+            for callback in self.oyentes:
+                try:
+                    callback(simbolo, anterior, actual)
+                except Exception as e:
+                    logging.error(f"Error en oyente del libro de posiciones: {e}")
+
+    def al_cuenta(self, evento):
+        # ACCOUNT_UPDATE: {"T": ..., "a": {"P": [{"s", "pa", "ep", "up", "ps"}, ...]}}
+        transaccion = evento.get('T', evento.get('E', 0))
+        for p in evento.get('a', {}).get('P', []):
+            if p.get('ps', 'BOTH') != 'BOTH':
+                continue
+            self._actualizar(p['s'], {
+                'cantidad': float(p['pa']),
+                'precio_entrada': float(p.get('ep') or 0),
+                'pnl_no_realizado': float(p.get('up') or 0),
+                'actualizado': transaccion,
+            })
+
+    def al_orden(self, evento):
+        # ORDER_TRADE_UPDATE: solo interesan las ejecuciones (x == TRADE). Si ya llegó
+        # un ACCOUNT_UPDATE igual o más reciente, ese valor absoluto manda.
+        orden = evento.get('o', {})
+        if orden.get('x') != 'TRADE' or orden.get('ps', 'BOTH') != 'BOTH':
+            return
+        simbolo = orden['s']
+        transaccion = orden.get('T', evento.get('T', 0))
+        self._registrar_fill(simbolo, orden, transaccion)
+        anterior = self.posiciones.get(simbolo)
+        if anterior and anterior['actualizado'] >= transaccion:
+            return
+        delta = float(orden['l']) if orden['S'] == 'BUY' else -float(orden['l'])
+        cantidad = (anterior['cantidad'] if anterior else 0.0) + delta
+        self._actualizar(simbolo, {
+            'cantidad': cantidad,
+            'precio_entrada': anterior['precio_entrada'] if anterior and anterior['cantidad'] else float(orden.get('L') or 0),
+            'pnl_no_realizado': anterior['pnl_no_realizado'] if anterior else 0.0,
+            'actualizado': transaccion,
+        })
+
+    def _sembrar_ciclo(self, simbolo, actual):
+        # positionRisk manda: un ciclo que no cuadra con el exchange (fills perdidos)
+        # se reinicia desde la posición real, sin atribuirle un cierre. Igual que en
+        # _actualizar, una instantánea anterior al último fill aplicado no cuenta: si se
+        # tomó justo antes de un fill de cierre, resucitaría el ciclo ya cerrado.
+        with self._bloqueo:
+            if actual['actualizado'] < self.ultimo_fill.get(simbolo, 0):
+                return
+            ciclo = self.ciclos.get(simbolo)
+            if ciclo and round(ciclo['cantidad'] - actual['cantidad'], 10) == 0:
+                return
+            if not actual['cantidad']:
+                self.ciclos.pop(simbolo, None)
+                return
+            self.ciclos[simbolo] = {
+                'cantidad': actual['cantidad'],
+                'precio_entrada': actual['precio_entrada'],
+                'pnl': 0.0,
+                'volumen': abs(actual['cantidad']) * actual['precio_entrada'],
+                'abierta': actual['actualizado'],
+            }
+
+    def _registrar_fill(self, simbolo, orden, transaccion):
+        cantidad = float(orden['l'])
+        precio = float(orden.get('L') or 0)
+        delta = cantidad if orden['S'] == 'BUY' else -cantidad
+        cierre = None
+        with self._bloqueo:
+            self.ultimo_fill[simbolo] = max(self.ultimo_fill.get(simbolo, 0), transaccion)
+            ciclo = self.ciclos.get(simbolo) or {'cantidad': 0.0, 'precio_entrada': 0.0, 'pnl': 0.0, 'volumen': 0.0, 'abierta': transaccion}
+            previa = ciclo['cantidad']
+            nueva = round(previa + delta, 10)
+            ciclo['pnl'] += float(orden.get('rp') or 0)
+            ciclo['volumen'] += cantidad * precio
+            if previa and (not nueva or (nueva > 0) != (previa > 0)):
+                cierre = {
+                    'simbolo': simbolo,
+                    'lado': 'BUY' if previa > 0 else 'SELL',
+                    'cantidad': abs(previa),
+                    'precio_entrada': ciclo['precio_entrada'],
+                    'precio_salida': precio,
+                    'pnl': ciclo['pnl'],
+                    'volumen': ciclo['volumen'],
+                    'abierta': ciclo['abierta'],
+                    'cerrada': transaccion,
+                    # t: id del trade que cerró; sin él, orden + instante
+                    'clave': f"{simbolo}:{orden.get('t') or str(orden.get('i')) + '@' + str(transaccion)}",
+                }
+                self.cierres += 1
+                # Si el fill le dio la vuelta, el resto abre un ciclo nuevo a ese precio
+                ciclo = {'cantidad': 0.0, 'precio_entrada': precio, 'pnl': 0.0, 'volumen': 0.0, 'abierta': transaccion}
+                previa = 0.0
+            if not previa:
+                ciclo['precio_entrada'] = precio
+                ciclo['abierta'] = transaccion
+            elif abs(nueva) > abs(previa):
+                # Ampliación: precio medio ponderado
+                ciclo['precio_entrada'] = (ciclo['precio_entrada'] * abs(previa) + precio * (abs(nueva) - abs(previa))) / abs(nueva)
+            ciclo['cantidad'] = nueva
+            if nueva:
+                self.ciclos[simbolo] = ciclo
+            else:
+                self.ciclos.pop(simbolo, None)
+        if cierre:
+            for callback in self.oyentes_cierre:
+                try:
+                    callback(cierre)
+                except Exception as e:
+                    logging.error(f"Error en oyente de cierres del libro de posiciones: {e}")
+
+    def al_conectar(self, evento):
+        # Tras una (re)conexión pueden faltar eventos: se resiembra fuera del hilo del stream
+        Thread(target=self._resembrar, daemon=True).start()
+
+    def _resembrar(self):
+        try:
+            self.sembrar()
+        except Exception as e:
+            logging.error(f"Error al resembrar el libro de posiciones: {e}")
+
+    def cantidad(self, simbolo):
+        # None significa "no sincronizado": quien llama debe consultar al exchange
+        if not self.sincronizado:
+            return None
+        posicion = self.posiciones.get(normalizar_simbolo(simbolo))
+        return posicion['cantidad'] if posicion else 0.0
+
+    def estado(self):
+        return {
+            'sincronizado': self.sincronizado,
+            'abiertas': {s: p['cantidad'] for s, p in self.posiciones.items() if p['cantidad']},
+            'reconciliaciones': self.reconciliaciones,
+            'discrepancias': self.discrepancias,
+            'cierres': self.cierres,
+        }
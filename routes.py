@@ -1,13 +1,75 @@
-from flask import render_template, request, jsonify, flash, redirect, url_for
+from flask import render_template, request, jsonify, flash, redirect, url_for, make_response
 from app import app, db
 from models import Trade, Position, BotSettings, TradingPair, TradingAnalytics, OrderStatus, OrderSide, OrderType, PositionStatus
-from trading_bot import trading_bot
+import trading_bot
+from trading_bot import motor
+from eventos import evento_balance, evento_posicion
+from mercados import normalizar_simbolo
+from analitica import calcular_analiticas, calcular_analiticas_por_simbolo, analizar_ventana
+from instantaneas import CacheInstantaneas
+from paginacion import consultar_trades, LIMITE_POR_DEFECTO
+import os
 import json
+import hashlib
 import logging
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Balance, positions and server time come from a snapshot shared by all workers,
+# refreshed at most once per TTL (see instantaneas.py)
+snapshots = CacheInstantaneas(ttl=float(os.environ.get('SNAPSHOT_TTL', 5)))
+
+def get_snapshot(key, load):
+    """Return (value, age in ms) of a shared exchange snapshot"""
+    value, age = snapshots.obtener(key, load)
+    return value, int(age * 1000)
+
+def engine():
+    """Trading engine module, once its components are built"""
+    if not motor.disponible():
+        raise RuntimeError(f"Trading engine not available: {motor.error or motor.fase}")
+    return trading_bot
+
+def load_positions():
+    """Open positions in the same shape as the SSE position events"""
+    libro = engine().libro_posiciones
+    if libro.sincronizado:
+        current = dict(libro.posiciones)
+    else:
+        # User stream disabled or not seeded yet: read positionRisk directly
+        current = {p['symbol']: {
+            'cantidad': float(p['positionAmt']),
+            'precio_entrada': float(p.get('entryPrice') or 0),
+            'pnl_no_realizado': float(p.get('unRealizedProfit') or 0),
+        } for p in trading_bot.descargar_posiciones() if p.get('positionSide', 'BOTH') == 'BOTH'}
+    return [evento_posicion(symbol, p) for symbol, p in current.items() if p['cantidad']]
+
+def load_balance():
+    """USDT futures balance in the same shape as the SSE balance events"""
+    balance = engine().servicio_balance.instantanea(engine().servicio_balance.frescura_ms)
+    return dict(evento_balance(balance), total_unrealized_pnl=sum(p['pnl'] for p in load_positions()))
+
+def load_server_time():
+    return engine().exchange.fetch_time()
+
+def date_arg(name):
+    """ISO date query param; unlike type=, a malformed value raises ValueError"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"invalid date for '{name}': {value}")
+
+def with_snapshot_age(response, age_ms):
+    """Tag a response with the age of the exchange data it carries"""
+    response = make_response(response)
+    response.headers['Age'] = str(age_ms // 1000)
+    response.headers['X-Snapshot-Age-Ms'] = str(age_ms)
+    return response
+
 @app.route('/')
 def index():
     """Main dashboard page"""
@@ -19,16 +81,17 @@ def index():
         open_positions = Position.query.filter_by(status=PositionStatus.OPEN).all()
         
         # Get account balance
-        balance = trading_bot.get_account_balance()
+        balance, age_ms = get_snapshot('balance', load_balance)
         
         # Get bot settings
         settings = BotSettings.query.first()
         
-        return render_template('index.html',
-                             trades=recent_trades,
-                             positions=open_positions,
-                             balance=balance,
-                             settings=settings)
+        return with_snapshot_age(render_template('index.html',
+                                                 trades=recent_trades,
+                                                 positions=open_positions,
+                                                 balance=balance,
+                                                 snapshot_age_ms=age_ms,
+                                                 settings=settings), age_ms)
     except Exception as e:
         logger.error(f"Error loading dashboard: {str(e)}")
         flash(f"Error loading dashboard: {str(e)}", "error")
@@ -38,48 +101,33 @@ def index():
                              balance=None, 
                              settings=None)
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    """TradingView webhook endpoint"""
-    try:
-        # Get JSON data from request
-        signal_data = request.get_json()
-        
-        if not signal_data:
-            return jsonify({'error': 'No data received'}), 400
-        
-        logger.info(f"Received webhook signal: {signal_data}")
-        
-        # Process the signal
-        result = trading_bot.process_webhook_signal(signal_data)
-        
-        return jsonify(result), 200
-        
-    except Exception as e:
-        logger.error(f"Webhook error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
 @app.route('/api/trades')
 def api_trades():
-    """API endpoint to get recent trades"""
+    """API endpoint to get trades, newest first, one keyset page at a time
+
+    Query params: limit, cursor (next_cursor of the previous page), symbol, status,
+    from/to (ISO dates), since_id (only trades inserted after that id, oldest first).
+    Rows come as arrays in the order of `columns`. Unchanged pages return 304.
+    """
     try:
-        trades = Trade.query.order_by(Trade.created_at.desc()).limit(20).all()
-        trades_data = []
-        
-        for trade in trades:
-            trades_data.append({
-                'id': trade.id,
-                'symbol': trade.symbol,
-                'side': trade.side.value,
-                'quantity': trade.quantity,
-                'price': trade.price,
-                'status': trade.status.value,
-                'created_at': trade.created_at.isoformat(),
-                'error_message': trade.error_message
-            })
-        
-        return jsonify(trades_data)
+        since_id = request.args.get('since_id', type=int)
+        body = consultar_trades(
+            limite=request.args.get('limit', LIMITE_POR_DEFECTO, type=int),
+            cursor=request.args.get('cursor'),
+            since_id=since_id,
+            symbol=request.args.get('symbol'),
+            status=request.args.get('status'),
+            desde=date_arg('from'),
+            hasta=date_arg('to'),
+        )
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(hashlib.sha256(response.get_data()).hexdigest()[:32])
+        # The browser may keep the page but must revalidate it on every poll
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting trades: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -89,7 +137,7 @@ def api_positions():
     """API endpoint to get positions"""
     try:
         # Get positions from database
-        db_positions = Position.query.filter_by(is_open=True).all()
+        db_positions = Position.query.filter_by(status=PositionStatus.OPEN).all()
         positions_data = []
         
         for pos in db_positions:
@@ -105,12 +153,13 @@ def api_positions():
             })
         
         # Get live positions from Binance
-        live_positions = trading_bot.get_open_positions()
+        live_positions, age_ms = get_snapshot('positions', load_positions)
         
-        return jsonify({
+        return with_snapshot_age(jsonify({
             'database_positions': positions_data,
-            'live_positions': live_positions
-        })
+            'live_positions': live_positions,
+            'snapshot_age_ms': age_ms
+        }), age_ms)
         
     except Exception as e:
         logger.error(f"Error getting positions: {str(e)}")
@@ -120,8 +169,10 @@ def api_positions():
 def api_balance():
     """API endpoint to get account balance"""
     try:
-        balance = trading_bot.get_account_balance()
-        return jsonify(balance if balance else {'error': 'Unable to fetch balance'})
+        balance, age_ms = get_snapshot('balance', load_balance)
+        if not balance:
+            return jsonify({'error': 'Unable to fetch balance'})
+        return with_snapshot_age(jsonify(dict(balance, snapshot_age_ms=age_ms)), age_ms)
         
     except Exception as e:
         logger.error(f"Error getting balance: {str(e)}")
@@ -153,10 +204,9 @@ def settings():
             
             db.session.commit()
             
-            # Reinitialize trading bot with new settings
-            trading_bot.initialize_client()
-            
-            flash('Settings updated successfully!', 'success')
+            # The engine reads its keys from BINANCE_API_KEY/BINANCE_SECRET and its
+            # trading options from config.json when it starts
+            flash('Settings updated successfully! Restart the bot to apply API or mode changes.', 'success')
             return redirect(url_for('settings'))
         
         # GET request - show settings form
@@ -172,19 +222,21 @@ def settings():
 def test_connection():
     """Test Binance API connection"""
     try:
-        if not trading_bot.client:
-            return jsonify({'error': 'No API connection configured'}), 400
+        if not motor.disponible():
+            return jsonify({'error': 'No API connection configured', 'reason': motor.error}), 400
         
         # Test connection by getting server time
-        server_time = trading_bot.client.get_server_time()
-        balance = trading_bot.get_account_balance()
+        server_time, time_age_ms = get_snapshot('server_time', load_server_time)
+        balance, balance_age_ms = get_snapshot('balance', load_balance)
+        age_ms = max(time_age_ms, balance_age_ms)
         
-        return jsonify({
+        return with_snapshot_age(jsonify({
             'success': True,
             'server_time': server_time,
             'balance': balance,
-            'testnet': trading_bot.settings.testnet
-        })
+            'testnet': trading_bot.config.get('sandbox_mode', False),
+            'snapshot_age_ms': age_ms
+        }), age_ms)
         
     except Exception as e:
         logger.error(f"Connection test failed: {str(e)}")
@@ -197,13 +249,9 @@ def analytics():
         # Get available trading pairs
         trading_pairs = TradingPair.query.filter_by(is_active=True).all()
         
-        # Get analytics for all pairs
-        analytics_data = {}
-        for pair in trading_pairs:
-            analytics_data[pair.symbol] = trading_bot.calculate_analytics(pair.symbol)
-        
-        # Get overall analytics
-        overall_analytics = trading_bot.calculate_analytics()
+        # Precomputed daily rollups: one query for every pair, one for the overall row
+        analytics_data = calcular_analiticas_por_simbolo([pair.symbol for pair in trading_pairs])
+        overall_analytics = calcular_analiticas()
         
         return render_template('analytics.html',
                              trading_pairs=trading_pairs,
@@ -273,18 +321,40 @@ def api_trading_pairs():
         logger.error(f"Error managing trading pairs: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analytics/<symbol>')
+@app.route('/api/analytics')
+@app.route('/api/analytics/<path:symbol>')
 def api_analytics(symbol=None):
     """API endpoint for trading analytics"""
     try:
-        days = request.args.get('days', 30, type=int)
-        analytics = trading_bot.calculate_analytics(symbol, days)
+        # Rollups and closes are stored as ETHUSDT; accept ETH/USDT and ETH/USDT:USDT too
+        symbol = normalizar_simbolo(symbol) if symbol else None
+        # Ad-hoc window (from/to or hours): vectorized pass over closed positions,
+        # every symbol plus the overall row when no symbol is given
+        desde = date_arg('from')
+        hasta = date_arg('to')
+        horas = request.args.get('hours')
+        if horas:
+            try:
+                horas = float(horas)
+            except ValueError:
+                raise ValueError(f"invalid number for 'hours': {horas}")
+            # One "now" for both ends of the window
+            hasta = hasta or datetime.utcnow()
+            desde = hasta - timedelta(hours=horas)
+        if desde or hasta:
+            resultado = analizar_ventana(desde, hasta, symbol, curva=request.args.get('curve') == '1')
+            analytics = resultado.get(symbol, None) if symbol else resultado
+        else:
+            days = request.args.get('days', 30, type=int)
+            analytics = calcular_analiticas(symbol, days)
         
         if analytics:
             return jsonify(analytics)
         else:
             return jsonify({'error': 'No data available for analysis'}), 404
             
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting analytics: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,110 @@
+import re
+import json
+import time
+import logging
+from dataclasses import dataclass, field
+
+# === PARSER DE SEÑALES DE TRADINGVIEW ===
+# Un único patrón precompilado recorre el mensaje una sola vez y extrae la primera
+# aparición de cada campo, igual que las tres re.search independientes de antes.
+# La alternativa de la acción solo consume "orden " (la palabra va en un lookahead)
+# para que un campo que empiece dentro de ella se siga encontrando; el único hueco
+# que queda, "en ..." dentro de "orden ", se comprueba aparte. También acepta la
+# alerta como JSON estructurado.
+
+PATRON_SENAL = re.compile(
+    r"orden (?=(?P<accion>\w+))"
+    r"|en (?P<ticker>[A-Z0-9/]+)"
+    r"|nueva posición estratégica es (?P<posicion>[\-0-9.]+)"
+)
+PATRON_TICKER = re.compile(r"en ([A-Z0-9/]+)")
+
+CAMPOS_JSON = {
+    'accion': ('accion', 'action'),
+    'ticker': ('ticker', 'symbol'),
+    'posicion_final': ('posicion_final', 'position_size', 'posicion'),
+}
+
+@dataclass(slots=True)
+class Senal:
+    accion: str
+    ticker: str
+    posicion_final: float
+    # Clave de idempotencia de la alerta; de ella y del nonce salen los newClientOrderId
+    clave: str = ''
+    # Distingue esta señal de una repetición idéntica aceptada más tarde (tras el TTL
+    # de deduplicación): cada señal parseada tiene el suyo
+    nonce: int = field(default_factory=time.time_ns)
+
+def _parsear_texto(mensaje):
+    accion = ticker = posicion = None
+    for coincidencia in PATRON_SENAL.finditer(mensaje):
+        grupo = coincidencia.lastgroup
+        if grupo == 'accion':
+            if ticker is None:
+                oculto = PATRON_TICKER.match(mensaje, coincidencia.start() + 3)
+                if oculto:
+                    ticker = oculto.group(1)
+            if accion is None:
+                accion = coincidencia.group('accion')
+        elif grupo == 'ticker':
+            if ticker is None:
+                ticker = coincidencia.group('ticker')
+        elif posicion is None:
+            posicion = coincidencia.group('posicion')
+        if accion is not None and ticker is not None and posicion is not None:
+            break
+    if accion is None or ticker is None or posicion is None:
+        logging.error("No se pudieron extraer todos los datos necesarios del mensaje.")
+        return None
+    return Senal(accion.lower(), ticker, float(posicion))
+
+def _parsear_json(datos):
+    valores = {}
+    for campo, claves in CAMPOS_JSON.items():
+        valores[campo] = next((datos[c] for c in claves if datos.get(c) not in (None, '')), None)
+    if any(v is None for v in valores.values()):
+        logging.error(f"Alerta JSON incompleta, faltan campos: {[c for c, v in valores.items() if v is None]}")
+        return None
+    return Senal(str(valores['accion']).lower(), str(valores['ticker']).upper(), float(valores['posicion_final']))
+
+def parsear_senal(mensaje):
+    try:
+        if isinstance(mensaje, dict):
+            return _parsear_json(mensaje)
+        if mensaje.lstrip().startswith('{'):
+            return _parsear_json(json.loads(mensaje))
+        return _parsear_texto(mensaje)
+    except Exception as e:
+        logging.error(f"Error al procesar la señal: {e}")
+        return None
+
+def anula_pendientes(senal):
+    # La ejecución es incremental: una señal con posición distinta de cero abre otro
+    # tamaño (o cierra la contraria y abre), así que el resultado de una secuencia
+    # depende de todas sus señales. Solo un cierre (posicion_final == 0) deja el
+    # símbolo plano sea cual sea lo anterior: es la única señal que puede reemplazar
+    # a las pendientes sin cambiar el resultado.
+    return senal.posicion_final == 0
+
+# === MICRO-BENCHMARK: python senales.py ===
+if __name__ == "__main__":
+    import timeit
+
+    def parsear_con_tres_busquedas(mensaje):
+        accion_match = re.search(r"orden (\w+)", mensaje)
+        ticker_match = re.search(r"en ([A-Z0-9/]+)", mensaje)
+        posicion_match = re.search(r"nueva posición estratégica es ([\-0-9.]+)", mensaje)
+        return {"accion": accion_match.group(1).lower(), "ticker": ticker_match.group(1), "posicion_final": float(posicion_match.group(1))}
+
+    mensaje = "La orden buy @ 0.25 se llenó en ETHUSDT. La nueva posición estratégica es 0.25"
+    alerta = '{"action": "buy", "ticker": "ETHUSDT", "position_size": 0.25}'
+    repeticiones = 200000
+
+    for nombre, funcion in (
+        ("re.search x3 (anterior)", lambda: parsear_con_tres_busquedas(mensaje)),
+        ("parsear_senal texto", lambda: parsear_senal(mensaje)),
+        ("parsear_senal JSON", lambda: parsear_senal(alerta)),
+    ):
+        segundos = min(timeit.repeat(funcion, number=repeticiones, repeat=3))
+        print(f"{nombre:<26} {segundos / repeticiones * 1e6:.2f} µs/mensaje")
@@ -2,13 +2,23 @@
 
 // Global variables
 let refreshInterval = null;
-let isRefreshing = false;
+let isRefreshing = { trades: false, positions: false };
+let eventSource = null;
+let currentTrades = [];
+let currentPositions = { database_positions: [], live_positions: [] };
+const MAX_TRADES = 20;
+let tradesLimit = MAX_TRADES;
+let tradesEtag = null;
+let nextTradesCursor = null;
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
     initializeApp();
     setupEventListeners();
-    startAutoRefresh();
+    // Load the tables once so pushed updates have rows to patch
+    refreshTrades();
+    refreshPositions();
+    startLiveUpdates();
 });
 
 // Initialize application
@@ -83,21 +93,31 @@ function copyWebhookUrl() {
 
 // Refresh trades table
 function refreshTrades() {
-    if (isRefreshing) return;
+    if (isRefreshing.trades) return;
     
-    isRefreshing = true;
+    isRefreshing.trades = true;
     const tradesTable = document.getElementById('tradesTable');
     
     if (tradesTable) {
         tradesTable.classList.add('loading');
         
-        fetch('/api/trades')
-            .then(response => response.json())
+        // The browser revalidates with If-None-Match; an unchanged page keeps its ETag
+        fetch(`/api/trades?limit=${tradesLimit}`)
+            .then(response => {
+                const etag = response.headers.get('ETag');
+                if (response.ok && etag && etag === tradesEtag) {
+                    return null;
+                }
+                tradesEtag = etag;
+                return response.json();
+            })
             .then(data => {
+                if (!data) return;
                 if (data.error) {
                     throw new Error(data.error);
                 }
-                updateTradesTable(data);
+                nextTradesCursor = data.next_cursor;
+                updateTradesTable(rowsToObjects(data));
             })
             .catch(error => {
                 console.error('Error refreshing trades:', error);
@@ -105,16 +125,54 @@ function refreshTrades() {
             })
             .finally(() => {
                 tradesTable.classList.remove('loading');
-                isRefreshing = false;
+                isRefreshing.trades = false;
             });
     }
 }
 
+// Append the next (older) page of trades
+function loadMoreTrades() {
+    if (!nextTradesCursor || isRefreshing.trades) return;
+
+    isRefreshing.trades = true;
+    fetch(`/api/trades?limit=${MAX_TRADES}&cursor=${encodeURIComponent(nextTradesCursor)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            const olderTrades = rowsToObjects(data);
+            tradesLimit = currentTrades.length + olderTrades.length;
+            // The first page changed size: its ETag no longer applies
+            tradesEtag = null;
+            nextTradesCursor = data.next_cursor;
+            updateTradesTable(currentTrades.concat(olderTrades));
+        })
+        .catch(error => {
+            console.error('Error loading trades:', error);
+            showNotification('Failed to load trades: ' + error.message, 'error');
+        })
+        .finally(() => {
+            isRefreshing.trades = false;
+        });
+}
+
+// /api/trades sends {columns, rows}; the table code works with objects
+function rowsToObjects(data) {
+    return data.rows.map(row => {
+        const item = {};
+        data.columns.forEach((column, index) => {
+            item[column] = row[index];
+        });
+        return item;
+    });
+}
+
 // Refresh positions table
 function refreshPositions() {
-    if (isRefreshing) return;
+    if (isRefreshing.positions) return;
     
-    isRefreshing = true;
+    isRefreshing.positions = true;
     const positionsTable = document.getElementById('positionsTable');
     
     if (positionsTable) {
@@ -134,13 +192,14 @@ function refreshPositions() {
             })
             .finally(() => {
                 positionsTable.classList.remove('loading');
-                isRefreshing = false;
+                isRefreshing.positions = false;
             });
     }
 }
 
 // Update trades table
 function updateTradesTable(trades) {
+    currentTrades = trades;
     const tradesTable = document.getElementById('tradesTable');
     if (!tradesTable) return;
     
@@ -196,6 +255,13 @@ function updateTradesTable(trades) {
     });
     
     tableHTML += '</tbody></table></div>';
+    if (nextTradesCursor) {
+        tableHTML += `
+            <div class="text-center">
+                <button class="btn btn-sm btn-outline-secondary" onclick="loadMoreTrades()">Load older trades</button>
+            </div>
+        `;
+    }
     tradesTable.innerHTML = tableHTML;
     
     // Reinitialize tooltips
@@ -204,6 +270,7 @@ function updateTradesTable(trades) {
 
 // Update positions table
 function updatePositionsTable(data) {
+    currentPositions = data;
     const positionsTable = document.getElementById('positionsTable');
     if (!positionsTable) return;
     
@@ -394,14 +461,77 @@ function showNotification(message, type = 'info') {
     }
 }
 
+// Subscribe to server-pushed updates (/api/stream), polling only as a fallback
+function startLiveUpdates() {
+    if (!window.EventSource) {
+        startAutoRefresh();
+        return;
+    }
+    if (eventSource) return;
+
+    eventSource = new EventSource('/api/stream');
+    eventSource.addEventListener('trade', event => applyTradeEvent(JSON.parse(event.data)));
+    eventSource.addEventListener('position', event => applyPositionEvent(JSON.parse(event.data)));
+    eventSource.addEventListener('balance', event => applyBalanceEvent(JSON.parse(event.data)));
+    // Missed more events than the server keeps: reload the tables once
+    eventSource.addEventListener('resync', () => {
+        refreshTrades();
+        refreshPositions();
+    });
+    eventSource.onopen = () => stopAutoRefresh();
+    eventSource.onerror = () => {
+        // The browser reconnects on its own; poll until it does
+        startAutoRefresh();
+        if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+            eventSource = null;
+        }
+    };
+}
+
+function stopLiveUpdates() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
+
+function applyTradeEvent(trade) {
+    const index = currentTrades.findIndex(t => t.client_order_id && t.client_order_id === trade.client_order_id);
+    if (index >= 0) {
+        currentTrades[index] = Object.assign({}, currentTrades[index], trade);
+    } else {
+        currentTrades.unshift(trade);
+    }
+    updateTradesTable(currentTrades);
+}
+
+function applyPositionEvent(position) {
+    const livePositions = (currentPositions.live_positions || []).filter(p => p.symbol !== position.symbol);
+    if (position.size > 0) {
+        livePositions.unshift(position);
+    }
+    updatePositionsTable(Object.assign({}, currentPositions, { live_positions: livePositions }));
+}
+
+function applyBalanceEvent(balance) {
+    document.querySelectorAll('[data-balance-field]').forEach(element => {
+        const value = balance[element.dataset.balanceField];
+        if (value !== null && value !== undefined) {
+            element.textContent = `$${parseFloat(value).toFixed(2)}`;
+        }
+    });
+    document.querySelectorAll('[data-balance-age]').forEach(element => {
+        element.textContent = 'updated just now';
+    });
+}
+
 // Start auto-refresh
 function startAutoRefresh() {
+    if (refreshInterval) return;
     // Refresh every 30 seconds
     refreshInterval = setInterval(() => {
-        if (!isRefreshing) {
-            refreshTrades();
-            refreshPositions();
-        }
+        refreshTrades();
+        refreshPositions();
     }, 30000);
 }
 
@@ -416,12 +546,13 @@ function stopAutoRefresh() {
 // Handle page visibility changes
 document.addEventListener('visibilitychange', function() {
     if (document.hidden) {
+        stopLiveUpdates();
         stopAutoRefresh();
     } else {
-        startAutoRefresh();
-        // Refresh immediately when page becomes visible
+        // Catch up once, then follow the stream again
         refreshTrades();
         refreshPositions();
+        startLiveUpdates();
     }
 });
 
@@ -462,5 +593,6 @@ function getPnlClass(pnl) {
 // Export functions for global access
 window.copyWebhookUrl = copyWebhookUrl;
 window.refreshTrades = refreshTrades;
+window.loadMoreTrades = loadMoreTrades;
 window.refreshPositions = refreshPositions;
 window.testConnection = testConnection;
@@ -1,37 +1,42 @@
-import ccxt
 import time
 import traceback
 import json
 import os
 from datetime import datetime
-import requests
-import streamlit as st
-from queue import Queue
-from threading import Thread
-import re
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Thread, Lock, Event
 import logging
 from tenacity import retry, stop_after_attempt, wait_fixed  # Para reintentos automáticos
-import pandas as pd
-import plotly.express as px
-
-# === CONFIGURACIÓN DE LOGGING ===
-logging.basicConfig(filename='bot_trading.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# === CONFIGURACIÓN SEGURA DE CLAVES API ===
-api_key = os.getenv("BINANCE_API_KEY")
-secret = os.getenv("BINANCE_SECRET")
-
-if not api_key or not secret:
-    raise ValueError("Claves API no configuradas. Asegúrate de configurar BINANCE_API_KEY y BINANCE_SECRET como variables de entorno.")
+from mercados import IndiceMercados, sincronizar_trading_pairs, normalizar_simbolo
+from cola_ejecucion import ColaEjecucion
+from libro_ordenes import CacheTopeLibro, URL_FUTUROS, URL_FUTUROS_TESTNET
+from flujo_usuario import FlujoUsuario, EVENTO_CONEXION
+from posiciones import LibroPosiciones
+from balance import ServicioBalance
+from metricas import RegistroTiempos, medir
+from notificaciones import DespachadorNotificaciones, Destino
+from senales import parsear_senal, anula_pendientes
+from idempotencia import RegistroIdempotencia
+from ordenes import RegistroOrdenes
+from ejecucion import (PasosEjecucion, precio_para_orden, precio_para_cierre, direccion_cierre,
+                       cantidad_en_posiciones, patas_volteo)
+from persistencia import EscritorDiferido
+from eventos import BusEventos, evento_orden, evento_posicion, evento_balance
+
+# === ARRANQUE EXPLÍCITO ===
+# Importar este módulo no lee config.json, no exige las claves, no construye el
+# cliente ccxt ni arranca hilos: todo eso lo hace motor.iniciar() (ver MotorTrading,
+# al final). Hasta entonces los componentes de abajo valen None.
 
 # === CARGA DE CONFIGURACIÓN ===
-try:
-    with open('config.json', 'r') as config_file:
-        config = json.load(config_file)
-except FileNotFoundError:
-    raise FileNotFoundError("El archivo 'config.json' no se encuentra. Asegúrate de que exista.")
-except json.JSONDecodeError:
-    raise ValueError("El archivo 'config.json' tiene errores de formato JSON. Verifica su contenido.")
+def cargar_configuracion(ruta='config.json'):
+    try:
+        with open(ruta, 'r') as config_file:
+            return json.load(config_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"El archivo '{ruta}' no se encuentra. Asegúrate de que exista.")
+    except json.JSONDecodeError:
+        raise ValueError(f"El archivo '{ruta}' tiene errores de formato JSON. Verifica su contenido.")
 
 # === VALIDACIÓN DE CONFIGURACIÓN ===
 def validar_configuracion(config):
@@ -44,248 +49,576 @@ def validar_configuracion(config):
     if not (0 < config['tp_ratio'] < 1):
         raise ValueError("El tp_ratio debe ser un valor entre 0 y 1.")
 
-validar_configuracion(config)
+# === CONFIGURACIÓN SEGURA DE CLAVES API ===
+def leer_claves_api():
+    api_key = os.getenv("BINANCE_API_KEY")
+    secret = os.getenv("BINANCE_SECRET")
+    if not api_key or not secret:
+        raise ValueError("Claves API no configuradas. Asegúrate de configurar BINANCE_API_KEY y BINANCE_SECRET como variables de entorno.")
+    return api_key, secret
+
+# === COMPONENTES DEL MOTOR (los crea construir_componentes) ===
+config = None
+opciones_exchange = None
+exchange = None
+indice_mercados = None
+libro_ordenes = None
+libro_posiciones = None
+flujo_usuario = None
+servicio_balance = None
+escritor_diferido = None
+bus_eventos = None
+registro_ordenes = None
+pasos_ejecucion = None
+pool_lecturas = None
+registro_tiempos = None
+despachador_notificaciones = None
+cola_ejecucion = None
+motor_async = None
+registro_idempotencia = None
+
+def descargar_posiciones():
+    return exchange.fapiPrivate_get_positionrisk()
+
+def registrar_cambio_posicion(simbolo, anterior, actual):
+    # La siembra inicial trae todos los símbolos del exchange; los que nunca tuvieron posición no cuentan
+    if anterior is None and not actual['cantidad']:
+        return
+    escritor_diferido.encolar('posicion', dict(actual, simbolo=simbolo))
 
-# === CONFIGURACIÓN API BINANCE ===
-exchange = ccxt.binance({
-    'apiKey': api_key,
-    'secret': secret,
-    'enableRateLimit': True,
-    'options': {
-        'defaultType': 'future',
-        'adjustForTimeDifference': True
+def publicar_cambio_posicion(simbolo, anterior, actual):
+    if anterior is None and not actual['cantidad']:
+        return
+    bus_eventos.publicar('position', evento_posicion(simbolo, actual))
+
+def registrar_cambio_orden(orden):
+    # Cada cambio de una orden acaba en Trade a través del escritor diferido y sale por el bus
+    escritor_diferido.encolar('orden', orden)
+    bus_eventos.publicar('trade', evento_orden(orden))
+
+def registrar_senales_reemplazadas(reemplazadas, nueva):
+    escritor_diferido.encolar('reemplazada', (reemplazadas, nueva))
+
+def construir_cliente(configuracion, api_key, secret):
+    # Cliente ccxt y servicio de balance, sin hilos ni red: es todo lo que necesita
+    # un lector como el dashboard de Streamlit (MotorTrading.iniciar_lectura)
+    global config, opciones_exchange, exchange, servicio_balance
+
+    # ccxt tarda en importarse: se paga al arrancar el motor, no al importar el módulo
+    import ccxt
+
+    config = configuracion
+
+    # === CONFIGURACIÓN API BINANCE ===
+    opciones_exchange = {
+        'apiKey': api_key,
+        'secret': secret,
+        'enableRateLimit': True,
+        'options': {
+            'defaultType': 'future',
+            'adjustForTimeDifference': True
+        }
     }
-})
-
-if config.get('sandbox_mode', False):
-    exchange.set_sandbox_mode(True)
-    print("Modo Sandbox activado: Las operaciones no serán reales.")
-
-# === CONTROLADOR DE VELOCIDAD DE LA API ===
-class ControladorAPI:
-    def __init__(self, limite=10):
-        self.cola = Queue()
-        self.limite = limite
-        self.trabajador = Thread(target=self._procesar_cola)
-        self.trabajador.daemon = True
-        self.trabajador.start()
-
-    def _procesar_cola(self):
-        while True:
-            funcion, args, kwargs = self.cola.get()
-            try:
-                time.sleep(1 / self.limite)
-                funcion(*args, **kwargs)
-            except Exception as e:
-                logging.error(f"Error en solicitud API: {e}")
-            self.cola.task_done()
-
-    def agregar_solicitud(self, funcion, *args, **kwargs):
-        self.cola.put((funcion, args, kwargs))
-
-controlador_api = ControladorAPI(limite=10)
+    exchange = ccxt.binance(opciones_exchange)
+
+    if config.get('sandbox_mode', False):
+        exchange.set_sandbox_mode(True)
+        print("Modo Sandbox activado: Las operaciones no serán reales.")
+
+    # === SERVICIO DE BALANCE ===
+    servicio_balance = ServicioBalance(
+        consultar_balance_futuros,
+        intervalo=config.get('intervalo_balance', 30),
+        frescura_ms=config.get('frescura_balance_ms', 5000)
+    )
+
+def construir_componentes(configuracion, api_key, secret):
+    # Solo objetos en memoria: ninguna llamada de red. Las cargas iniciales (mercados,
+    # balance, posiciones) y los streams los arranca MotorTrading._precalentar().
+    global indice_mercados, libro_ordenes, libro_posiciones
+    global flujo_usuario, escritor_diferido, bus_eventos, registro_ordenes, pasos_ejecucion
+    global pool_lecturas, registro_tiempos, despachador_notificaciones, cola_ejecucion
+    global motor_async, registro_idempotencia
+
+    construir_cliente(configuracion, api_key, secret)
+
+    # === ÍNDICE DE MERCADOS (step size, tick size, límites) ===
+    indice_mercados = IndiceMercados(
+        exchange,
+        ttl=config.get('ttl_mercados', 3600),
+        al_actualizar=sincronizar_trading_pairs
+    )
+
+    url_streams = config.get('ws_url') or (URL_FUTUROS_TESTNET if config.get('sandbox_mode', False) else URL_FUTUROS)
+
+    # === CACHÉ DE MEJOR BID/ASK (bookTicker) ===
+    libro_ordenes = CacheTopeLibro(
+        config.get('simbolos', [config['symbol']]),
+        url_base=url_streams,
+        max_edad=config.get('max_edad_cotizacion', 2.0)
+    )
+
+    # === LIBRO DE POSICIONES ALIMENTADO POR EL STREAM DE USUARIO ===
+    libro_posiciones = LibroPosiciones(
+        descargar_posiciones,
+        intervalo_reconciliacion=config.get('intervalo_reconciliacion', 300)
+    )
+    flujo_usuario = FlujoUsuario(exchange, url_streams)
+    flujo_usuario.suscribir('ACCOUNT_UPDATE', libro_posiciones.al_cuenta)
+    flujo_usuario.suscribir('ORDER_TRADE_UPDATE', libro_posiciones.al_orden)
+    flujo_usuario.suscribir(EVENTO_CONEXION, libro_posiciones.al_conectar)
+
+    # El balance se mantiene con el mismo stream de usuario
+    flujo_usuario.suscribir('ACCOUNT_UPDATE', servicio_balance.al_cuenta)
+
+    # === PERSISTENCIA DIFERIDA DE ÓRDENES Y POSICIONES ===
+    # La ejecución solo encola; el escritor hace un commit cada 'persistencia_max_filas'
+    # eventos o 'persistencia_max_espera_ms' milisegundos.
+    escritor_diferido = EscritorDiferido(
+        max_filas=config.get('persistencia_max_filas', 200),
+        max_espera_ms=config.get('persistencia_max_espera_ms', 250),
+        max_intentos=config.get('persistencia_max_intentos', 5),
+        archivo_descartes=config.get('persistencia_archivo_descartes', 'eventos_no_guardados.jsonl')
+    )
+    libro_posiciones.suscribir(registrar_cambio_posicion)
+    # Cada posición cerrada actualiza su fila (símbolo, día) de TradingAnalytics
+    libro_posiciones.suscribir_cierres(lambda cierre: escritor_diferido.encolar('cierre', cierre))
+
+    # === BUS DE EVENTOS DEL DASHBOARD (SSE en /api/stream) ===
+    bus_eventos = BusEventos(
+        historial=config.get('eventos_historial', 1000),
+        latido=config.get('eventos_latido', 15)
+    )
+    libro_posiciones.suscribir(publicar_cambio_posicion)
+    servicio_balance.suscribir(lambda instantanea: bus_eventos.publicar('balance', evento_balance(instantanea)))
+
+    # === REGISTRO LOCAL DE ÓRDENES ===
+    # Estado de cada orden enviada (por newClientOrderId) al día con ORDER_TRADE_UPDATE
+    registro_ordenes = RegistroOrdenes(persistir=registrar_cambio_orden)
+    flujo_usuario.suscribir('ORDER_TRADE_UPDATE', registro_ordenes.al_orden)
+
+    # === LECTURAS EN PARALELO Y TIEMPOS DEL PIPELINE ===
+    pool_lecturas = ThreadPoolExecutor(max_workers=config.get('hilos_lecturas', 8), thread_name_prefix='lecturas')
+    registro_tiempos = RegistroTiempos()
+
+    # === DESPACHO DE NOTIFICACIONES ===
+    # Un destino por plataforma configurada; cada uno entrega en paralelo con su
+    # propio límite de velocidad (notificaciones_por_segundo / notificaciones_rafaga).
+    # Con ventana_resumen_notificaciones > 0 las órdenes de una ráfaga llegan como un
+    # único resumen; los mensajes de nivel error se envían siempre al momento.
+    despachador_notificaciones = DespachadorNotificaciones()
+
+    telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+    telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID")
+    if telegram_bot_token and telegram_chat_id:
+        telegram_api_url = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+        despachador_notificaciones.registrar(Destino(
+            'telegram',
+            f"{telegram_api_url}/bot{telegram_bot_token}/sendMessage",
+            lambda texto: {'chat_id': telegram_chat_id, 'text': texto},
+            tasa=config.get('notificaciones_por_segundo', 1.0),
+            rafaga=config.get('notificaciones_rafaga', 5),
+            capacidad=config.get('notificaciones_capacidad', 100),
+            max_caracteres=4096,
+            ventana_resumen=config.get('ventana_resumen_notificaciones', 0)
+        ))
+
+    slack_webhook_url = os.getenv("SLACK_WEBHOOK_URL")
+    if slack_webhook_url:
+        despachador_notificaciones.registrar(Destino(
+            'slack',
+            slack_webhook_url,
+            lambda texto: {'text': texto},
+            tasa=config.get('notificaciones_por_segundo', 1.0),
+            rafaga=config.get('notificaciones_rafaga', 5),
+            capacidad=config.get('notificaciones_capacidad', 100),
+            max_caracteres=40000,
+            ventana_resumen=config.get('ventana_resumen_notificaciones', 0)
+        ))
+
+    # === PASOS COMUNES A LOS DOS MOTORES ===
+    # Tamaño, posición contraria, ids de cliente y contabilidad de cada orden
+    pasos_ejecucion = PasosEjecucion(config, indice_mercados, registro_ordenes, log_orden, notificar)
+
+    # === INGESTA ASÍNCRONA DE SEÑALES ===
+    # Un carril FIFO por símbolo: 'ETH/USDT' y 'ETHUSDT' comparten carril. Con
+    # 'cola_coalescer' un cierre reemplaza a las señales pendientes de su símbolo.
+    cola_ejecucion = ColaEjecucion(
+        ejecutar_senal,
+        clave=lambda senal: normalizar_simbolo(senal.ticker),
+        capacidad=config.get('cola_capacidad', 100),
+        trabajadores=config.get('cola_trabajadores', 4),
+        politica=config.get('cola_politica', 'descartar_antiguo'),
+        coalescer=config.get('cola_coalescer', False),
+        al_reemplazar=registrar_senales_reemplazadas,
+        anula=anula_pendientes
+    )
+
+    # === MOTOR ASYNCIO (opcional) ===
+    # Con 'motor': 'asyncio' las señales no pasan por la cola de hilos: se ejecutan
+    # como corrutinas sobre ccxt.async_support en un único event loop.
+    motor_async = None
+    if config.get('motor', 'hilos') == 'asyncio':
+        # Solo entonces se carga ccxt.async_support (y aiohttp)
+        from motor_async import MotorAsync
+
+        motor_async = MotorAsync(
+            opciones_exchange,
+            config,
+            indice_mercados,
+            libro_ordenes,
+            libro_posiciones,
+            servicio_balance,
+            registro_tiempos,
+            pasos_ejecucion,
+            procesar_senal_tv,
+            capacidad=config.get('cola_capacidad', 100),
+            coalescer=config.get('cola_coalescer', False),
+            al_reemplazar=registrar_senales_reemplazadas,
+            listo=motor.preparado,
+            espera_arranque=config.get('espera_arranque', 30)
+        )
+
+    # === DEDUPLICACIÓN DE SEÑALES ===
+    # 'dedup_persistente' respalda el conjunto de vistos en la tabla ProcessedSignal
+    # para que varios workers de gunicorn compartan la deduplicación. Las alertas sin
+    # id ni timestamp ({{timenow}}) solo se deduplican 'dedup_ttl_sin_id' segundos.
+    registro_idempotencia = RegistroIdempotencia(
+        ttl=config.get('dedup_ttl', 300),
+        ttl_sin_id=config.get('dedup_ttl_sin_id', 15),
+        capacidad=config.get('dedup_capacidad', 10000),
+        persistente=config.get('dedup_persistente', False)
+    )
 
 # === FUNCIONES AUXILIARES ===
 def enviar_notificacion_telegram(mensaje, nivel="info"):
     niveles = {"info": "ℹ️", "error": "❌", "success": "✅"}
     prefijo = niveles.get(nivel, "ℹ️")
     mensaje = f"{prefijo} {mensaje}"
-    telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
-    telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID")
-    if not telegram_bot_token or not telegram_chat_id:
+    if not despachador_notificaciones.enviar('telegram', mensaje, urgente=nivel == "error"):
         print("Telegram no configurado. Notificación no enviada.")
-        return
-    url = f"https://api.telegram.org/bot{telegram_bot_token}/sendMessage"
-    data = {'chat_id': telegram_chat_id, 'text': mensaje}
-    controlador_api.agregar_solicitud(requests.post, url, json=data)
 
-def enviar_notificacion_slack(mensaje):
-    slack_webhook_url = os.getenv("SLACK_WEBHOOK_URL")
-    if not slack_webhook_url:
+def enviar_notificacion_slack(mensaje, nivel="info"):
+    if not despachador_notificaciones.enviar('slack', mensaje, urgente=nivel == "error"):
         print("Slack no configurado. Notificación no enviada.")
-        return
-    data = {"text": mensaje}
-    controlador_api.agregar_solicitud(requests.post, slack_webhook_url, json=data)
+
+def notificar(mensaje, nivel="info"):
+    enviar_notificacion_telegram(mensaje, nivel)
+    enviar_notificacion_slack(mensaje, nivel)
 
 @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def obtener_balance_futuros():
+def consultar_balance_futuros():
     try:
-        balance = exchange.fetch_balance({'type': 'future'})
-        return balance['total']['USDT']
+        return exchange.fetch_balance({'type': 'future'})
     except Exception as e:
         logging.error(f"Error al obtener el balance: {e}")
         raise
 
+def obtener_balance_futuros(fresco_ms=None):
+    if fresco_ms is None:
+        fresco_ms = servicio_balance.frescura_ms
+    return servicio_balance.instantanea(fresco_ms)['total']
+
 def log_orden(tipo, symbol, direccion, cantidad, precio, opciones):
     timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
     log_message = f"[{timestamp}] Orden {tipo.upper()} enviada: {direccion.upper()} {cantidad} {symbol} a {precio}. Opciones: {opciones}"
     print(log_message)
-    enviar_notificacion_telegram(log_message)
-    enviar_notificacion_slack(log_message)
+    notificar(log_message)
+
+def obtener_mejor_precio(simbolo):
+    cotizacion = libro_ordenes.obtener(simbolo)
+    if cotizacion is not None:
+        return cotizacion
+    ticker = exchange.fetch_ticker(simbolo)
+    return ticker['bid'], ticker['ask']
 
 def obtener_precio_para_orden(simbolo, direccion, porcentaje_limite):
     try:
-        ticker = exchange.fetch_ticker(simbolo)
-        if direccion == 'buy':
-            return ticker['bid'] * (1 - porcentaje_limite)
-        elif direccion == 'sell':
-            return ticker['ask'] * (1 + porcentaje_limite)
+        bid, ask = obtener_mejor_precio(simbolo)
+        return precio_para_orden(bid, ask, direccion, porcentaje_limite)
     except Exception as e:
         logging.error(f"Error al obtener el precio límite: {e}")
         return None
 
-def enviar_orden_limite(simbolo, direccion, cantidad, precio):
+def enviar_orden_limite(simbolo, direccion, cantidad, precio, reduce_only=False, tipo="límite", client_order_id=None):
+    params = pasos_ejecucion.preparar(simbolo, direccion, cantidad, precio, tipo, reduce_only, client_order_id)
     try:
         orden = exchange.create_order(
             symbol=simbolo,
             type='limit',
             side=direccion,
             amount=cantidad,
-            price=precio
+            price=precio,
+            params=params
         )
-        log_orden("límite", simbolo, direccion, cantidad, precio, orden)
-        return orden
     except Exception as e:
-        logging.error(f"Error al enviar la orden límite: {e}")
+        pasos_ejecucion.fallida(simbolo, direccion, cantidad, precio, tipo, client_order_id, e)
         return None
+    pasos_ejecucion.aceptada(simbolo, direccion, cantidad, precio, tipo, client_order_id, orden)
+    return orden
 
 def obtener_precio_para_cierre(simbolo, direccion):
     try:
-        ticker = exchange.fetch_ticker(simbolo)
-        if direccion == 'sell':
-            return ticker['bid'] * 0.99
-        elif direccion == 'buy':
-            return ticker['ask'] * 1.01
+        bid, ask = obtener_mejor_precio(simbolo)
+        return precio_para_cierre(bid, ask, direccion)
     except Exception as e:
         logging.error(f"Error al calcular el precio para cierre: {e}")
         return None
 
-def cerrar_posicion_con_limite(simbolo):
+def obtener_cantidad_posicion(simbolo):
+    cantidad = libro_posiciones.cantidad(simbolo)
+    if cantidad is not None:
+        return cantidad
+    return cantidad_en_posiciones(descargar_posiciones(), simbolo)
+
+def cerrar_posicion_con_limite(simbolo, client_order_id=None):
     try:
-        posiciones = exchange.fapiPrivate_get_positionrisk()
-        posicion = next((p for p in posiciones if p['symbol'] == simbolo.replace('/', '') and float(p['positionAmt']) != 0), None)
+        cantidad_posicion = obtener_cantidad_posicion(simbolo)
+        if not cantidad_posicion:
+            print(f"No hay posiciones abiertas para {simbolo}.")
+            return
 
-        if posicion:
-            cantidad = abs(float(posicion['positionAmt']))
-            direccion = 'sell' if float(posicion['positionAmt']) > 0 else 'buy'
-            precio_limite = obtener_precio_para_cierre(simbolo, direccion)
+        direccion = direccion_cierre(cantidad_posicion)
+        precio_limite = obtener_precio_para_cierre(simbolo, direccion)
+        if precio_limite is None:
+            print(f"No se pudo calcular el precio límite para cerrar la posición en {simbolo}.")
+            return
 
-            if precio_limite is None:
-                print(f"No se pudo calcular el precio límite para cerrar la posición en {simbolo}.")
-                return
-
-            orden = exchange.create_order(
-                symbol=simbolo,
-                type='limit',
-                side=direccion,
-                amount=cantidad,
-                price=precio_limite
-            )
-            log_orden("cierre_límite", simbolo, direccion, cantidad, precio_limite, orden)
+        orden = enviar_orden_limite(simbolo, direccion, abs(cantidad_posicion), precio_limite,
+                                    tipo="cierre_límite", client_order_id=client_order_id)
+        if orden:
             print(f"Posición cerrada con orden límite para {simbolo}: {orden}")
-        else:
-            print(f"No hay posiciones abiertas para {simbolo}.")
     except Exception as e:
         logging.error(f"Error al cerrar posición con límite: {e}")
 
-def obtener_step_size(simbolo):
-    try:
-        mercados = exchange.fetch_markets()
-        for mercado in mercados:
-            if mercado['symbol'] == simbolo:
-                return float(mercado['info']['filters'][2]['stepSize'])
-        raise ValueError(f"Step size para {simbolo} no encontrado.")
-    except Exception as e:
-        logging.error(f"Error al obtener step size para {simbolo}: {e}")
-        return 0.01  # Valor por defecto si falla
-
-def calcular_tamano_operacion(balance, porcentaje, apalancamiento, min_tamano, max_tamano, step_size):
-    tamano = balance * (porcentaje / 100) * apalancamiento
-    tamano = max(min_tamano, min(tamano, max_tamano))
-    tamano = round(tamano / step_size) * step_size
-    return tamano
+def enviar_lote_ordenes(simbolo, patas):
+    # Todas las patas van en un único batchOrders; las que el exchange rechace (o
+    # todas, si rechaza el lote entero) se reenvían una a una (PasosEjecucion.repartir_lote)
+    respuestas = None
+    lote = pasos_ejecucion.preparar_lote(simbolo, patas)
+    if lote:
+        try:
+            respuestas = exchange.fapiPrivatePostBatchOrders({'batchOrders': json.dumps(lote)})
+        except Exception as e:
+            logging.error(f"batchOrders rechazado para {simbolo}; se envían las órdenes por separado: {e}")
+    return [
+        orden or enviar_orden_limite(simbolo, direccion, cantidad, precio, reduce_only, tipo, client_order_id)
+        for (tipo, direccion, cantidad, precio, reduce_only, client_order_id), orden
+        in pasos_ejecucion.repartir_lote(simbolo, patas, respuestas)
+    ]
+
+def voltear_posicion(simbolo, cantidad_abierta, direccion, cantidad, precio, id_cierre=None, id_entrada=None):
+    # Cierre reduce-only de la posición contraria y nueva entrada en un solo viaje
+    precio_cierre = obtener_precio_para_cierre(simbolo, direccion_cierre(cantidad_abierta))
+    if precio_cierre is None:
+        print(f"No se pudo calcular el precio límite para cerrar la posición en {simbolo}.")
+        return None
+    return enviar_lote_ordenes(simbolo, patas_volteo(cantidad_abierta, precio_cierre, direccion, cantidad, precio,
+                                                     id_cierre, id_entrada))
 
 def procesar_senal_tv(mensaje):
-    try:
-        accion_match = re.search(r"orden (\w+)", mensaje)
-        ticker_match = re.search(r"en ([A-Z0-9/]+)", mensaje)
-        posicion_match = re.search(r"nueva posición estratégica es ([\-0-9.]+)", mensaje)
-
-        if not accion_match or not ticker_match or not posicion_match:
-            logging.error("No se pudieron extraer todos los datos necesarios del mensaje.")
-            return None
-
-        accion = accion_match.group(1).lower()
-        ticker = ticker_match.group(1)
-        posicion_final = float(posicion_match.group(1))
-
-        return {"accion": accion, "ticker": ticker, "posicion_final": posicion_final}
-    except Exception as e:
-        logging.error(f"Error al procesar la señal: {e}")
-        return None
+    # Texto libre de TradingView o alerta JSON; devuelve un Senal o None
+    return parsear_senal(mensaje)
 
 def ejecutar_senal_tv(mensaje):
     senal = procesar_senal_tv(mensaje)
     if not senal:
         return
+    ejecutar_senal(senal)
 
-    accion = senal["accion"]
-    ticker = senal["ticker"]
-    posicion_final = senal["posicion_final"]
+def ejecutar_senal(senal):
+    accion = senal.accion
+    ticker = senal.ticker
+    posicion_final = senal.posicion_final
 
     print(f"Procesando señal: Acción: {accion}, Ticker: {ticker}, Posición estratégica: {posicion_final}")
 
-    try:
-        posiciones = exchange.fapiPrivate_get_positionrisk()
-        posicion_abierta = next((p for p in posiciones if p['symbol'] == ticker.replace('/', '') and float(p['positionAmt']) != 0), None)
+    # Una señal que llega durante el precalentamiento espera a que termine
+    if not motor.preparado.wait(config.get('espera_arranque', 30)):
+        logging.error(f"Motor sin precalentar tras {config.get('espera_arranque', 30)} s; señal {ticker} descartada.")
+        return
 
-        if posicion_abierta:
-            lado_actual = 'buy' if float(posicion_abierta['positionAmt']) > 0 else 'sell'
-            if lado_actual != accion:
-                print(f"Posición contraria detectada en {ticker}. Cerrando posición abierta antes de continuar.")
-                cerrar_posicion_con_limite(ticker)
+    id_cierre, id_entrada = pasos_ejecucion.ids(senal)
+
+    tiempos = {}
+    inicio = time.perf_counter()
+    try:
+        # Las lecturas son independientes entre sí: se lanzan a la vez y se esperan
+        # antes de dimensionar, así la latencia es la de la más lenta y no la suma.
+        lectura_posicion = pool_lecturas.submit(medir, tiempos, 'posicion', obtener_cantidad_posicion, ticker)
+        if posicion_final != 0:
+            lectura_balance = pool_lecturas.submit(medir, tiempos, 'balance', obtener_balance_futuros)
+            lectura_precio = pool_lecturas.submit(medir, tiempos, 'precio', obtener_precio_para_orden, ticker, accion, 0.001)
+
+        cantidad_abierta = lectura_posicion.result()
+        cerrar_antes, voltear = pasos_ejecucion.plan(senal, cantidad_abierta)
+        if cerrar_antes:
+            medir(tiempos, 'cierre', cerrar_posicion_con_limite, ticker, id_cierre)
 
         if posicion_final == 0:
             print(f"Cerrando posición en {ticker} debido a señal con posición estratégica = 0.")
-            cerrar_posicion_con_limite(ticker)
+            medir(tiempos, 'cierre', cerrar_posicion_con_limite, ticker, id_cierre)
         else:
-            balance = obtener_balance_futuros()
-            step_size = obtener_step_size(ticker)
-            tamano = calcular_tamano_operacion(
-                balance,
-                config['porcentaje_operacion'],
-                config['apalancamiento'],
-                config['min_tamano'],
-                config['max_tamano'],
-                step_size
-            )
-
-            precio_limite = obtener_precio_para_orden(ticker, accion, 0.001)
+            step_size = medir(tiempos, 'step_size', pasos_ejecucion.step_size, ticker)
+            balance = lectura_balance.result()
+            precio_limite = lectura_precio.result()
+            tiempos['lecturas'] = round((time.perf_counter() - inicio) * 1000, 2)
+
+            tamano = pasos_ejecucion.tamano(balance, step_size)
+
             if precio_limite is None:
                 print("No se pudo calcular el precio límite. Operación cancelada.")
                 return
 
-            enviar_orden_limite(ticker, accion, tamano, precio_limite)
+            if voltear:
+                medir(tiempos, 'flip', voltear_posicion, ticker, cantidad_abierta, accion, tamano, precio_limite, id_cierre, id_entrada)
+            else:
+                medir(tiempos, 'orden', enviar_orden_limite, ticker, accion, tamano, precio_limite, client_order_id=id_entrada)
     except Exception as e:
         logging.error(f"Error al ejecutar la señal: {e}")
         traceback.print_exc()
-
-def mostrar_dashboard():
-    st.title("Dashboard de Trading")
-    try:
-        balance = obtener_balance_futuros()
-        st.metric("Balance Actual (USDT)", balance)
-
-        posiciones = exchange.fapiPrivate_get_positionrisk()
-        df_posiciones = pd.DataFrame(posiciones)
-        st.write("Posiciones Actuales:")
-        st.dataframe(df_posiciones[["symbol", "positionAmt", "entryPrice"]])
-
-        fig = px.pie(df_posiciones, values='positionAmt', names='symbol', title="Distribución de Posiciones")
-        st.plotly_chart(fig)
-    except Exception as e:
-        st.error(f"Error al mostrar el dashboard: {e}")
-
-# === EJECUCIÓN PRINCIPAL ===
-if __name__ == "__main__":
-    mostrar_dashboard()
\ No newline at end of file
+    finally:
+        tiempos['total'] = round((time.perf_counter() - inicio) * 1000, 2)
+        registro_tiempos.registrar(tiempos)
+        logging.debug(f"Tiempos de la señal {ticker} (ms): {tiempos}")
+
+# === MOTOR: CONSTRUCCIÓN DIFERIDA Y PRECALENTAMIENTO ===
+# iniciar() lee la configuración y las claves y construye los componentes en el
+# hilo que llama, sin red, así que un worker de gunicorn arranca al instante; si
+# falta algo, el motor queda en 'error' con el motivo en lugar de reventar al
+# importar. Después, un hilo en segundo plano precalienta en paralelo lo que la
+# primera señal pagaría: mercados de ccxt y diferencia horaria, índice de
+# filtros, balance, siembra de posiciones y la conexión HTTP con el exchange;
+# luego abre los streams. Las señales que llegan antes se aceptan y esperan a
+# 'preparado' (hasta 'espera_arranque' segundos) antes de ejecutarse.
+#
+# iniciar_lectura() es el arranque de solo lectura (dashboard de Streamlit): cliente
+# ccxt y balance bajo demanda, sin streams, escritor, colas ni precalentamiento.
+#
+# Con gunicorn --preload, iniciar() debe llamarse en cada worker (post_fork): los
+# hilos no sobreviven al fork.
+
+PARADO = 'parado'
+LECTURA = 'lectura'
+PRECALENTANDO = 'precalentando'
+LISTO = 'listo'
+ERROR = 'error'
+
+class MotorTrading:
+    def __init__(self, ruta_config='config.json', archivo_log='bot_trading.log'):
+        self.ruta_config = ruta_config
+        self.archivo_log = archivo_log
+        self.fase = PARADO
+        self.error = None
+        self.errores_precalentamiento = {}
+        self.tiempos_ms = {}
+        self.preparado = Event()
+        self._bloqueo = Lock()
+
+    def _construir(self, construir):
+        try:
+            logging.basicConfig(filename=self.archivo_log, level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+            configuracion = cargar_configuracion(self.ruta_config)
+            validar_configuracion(configuracion)
+            construir(configuracion, *leer_claves_api())
+        except Exception as e:
+            self.fase = ERROR
+            self.error = str(e)
+            logging.error(f"No se pudo iniciar el motor: {e}")
+            return False
+        return True
+
+    def iniciar_lectura(self):
+        # Idempotente; si el motor completo ya está en marcha, sus componentes sirven igual
+        with self._bloqueo:
+            if self.fase != PARADO:
+                return self.fase != ERROR
+            if not self._construir(construir_cliente):
+                return False
+            self.fase = LECTURA
+            return True
+
+    def iniciar(self):
+        # Idempotente: solo la primera llamada construye y precalienta
+        with self._bloqueo:
+            if self.fase not in (PARADO, LECTURA):
+                return self.fase != ERROR
+            inicio = time.perf_counter()
+            if not self._construir(construir_componentes):
+                return False
+            self.tiempos_ms['construccion'] = round((time.perf_counter() - inicio) * 1000, 2)
+            self.fase = PRECALENTANDO
+        escritor_diferido.iniciar()
+        if motor_async:
+            motor_async.iniciar()
+        Thread(target=self._precalentar, name='precalentamiento', daemon=True).start()
+        return True
+
+    def _cargar_mercados(self):
+        # Una sola descarga de mercados: el índice la hace con load_markets() del
+        # cliente síncrono y el cliente asíncrono adopta el resultado
+        medir(self.tiempos_ms, 'indice_mercados', indice_mercados.iniciar)
+        if motor_async:
+            medir(self.tiempos_ms, 'motor_async', motor_async.precalentar, exchange.markets, exchange.currencies)
+
+    def _precalentar(self):
+        inicio = time.perf_counter()
+        tareas = {
+            'mercados': self._cargar_mercados,
+            'balance': servicio_balance.iniciar,
+        }
+        if config.get('usar_stream_usuario', True):
+            tareas['posiciones'] = libro_posiciones.iniciar
+        futuros = {nombre: pool_lecturas.submit(medir, self.tiempos_ms, nombre, tarea) for nombre, tarea in tareas.items()}
+        wait(futuros.values())
+        for nombre, futuro in futuros.items():
+            if futuro.exception():
+                # Se sigue: la primera señal usará los fallbacks REST de cada caché
+                self.errores_precalentamiento[nombre] = str(futuro.exception())
+                logging.error(f"Error al precalentar {nombre}: {futuro.exception()}")
+        if config.get('usar_stream_libro', True):
+            libro_ordenes.iniciar()
+        if config.get('usar_stream_usuario', True):
+            flujo_usuario.iniciar()
+        self.tiempos_ms['precalentamiento'] = round((time.perf_counter() - inicio) * 1000, 2)
+        self.fase = LISTO
+        self.preparado.set()
+        logging.info(f"Motor listo en {self.tiempos_ms['precalentamiento']} ms de precalentamiento.")
+
+    def disponible(self):
+        # Puede aceptar señales: construido, aunque aún esté precalentando
+        return self.fase in (PRECALENTANDO, LISTO)
+
+    def estado(self):
+        return {
+            'fase': self.fase,
+            'error': self.error,
+            'errores_precalentamiento': self.errores_precalentamiento,
+            'tiempos_ms': self.tiempos_ms,
+        }
+
+motor = MotorTrading()
+
+def encolar_senal(senal):
+    if motor_async:
+        return motor_async.enviar(senal)
+    return cola_ejecucion.encolar(senal)
+
+def estado_motor():
+    if not motor.disponible():
+        return {'motor': motor.estado()}
+    return {
+        'motor': motor.estado(),
+        'cola': cola_ejecucion.estado(),
+        'libro_ordenes': libro_ordenes.estado(),
+        'flujo_usuario': flujo_usuario.estado(),
+        'posiciones': libro_posiciones.estado(),
+        'balance': servicio_balance.estado(),
+        'tiempos_ms': registro_tiempos.resumen(),
+        'motor_async': motor_async.estado() if motor_async else None,
+        'notificaciones': despachador_notificaciones.estado(),
+        'idempotencia': registro_idempotencia.estado(),
+        'ordenes': registro_ordenes.estado(),
+        'persistencia': escritor_diferido.estado(),
+        'eventos': bus_eventos.estado(),
+    }